@@ -1,16 +1,31 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
+import asyncio
+import copy
+import types
 import datetime
+import functools
 import urllib.parse
 from fpdf import FPDF
 import os
+import re
 import unicodedata
+from table_utils import widen_float32
+
+# Optional: numba JIT for the batched TDEE kernel
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except Exception:
+    HAS_NUMBA = False
 
 # Initialize App
 app = FastAPI(title="Diet & Workout AI API")
@@ -25,6 +40,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# diet + exercise JSON compresses well; tiny responses are left alone
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # -------------------------
 # CONFIG & DATA LOADING
@@ -35,27 +52,153 @@ DATA_DIR = Path(r"C:\Users\Admin\OneDrive\Desktop\COLLEGE_WORK\Semester-project-
 GENERATED_PDF_DIR = Path.cwd() / "generated_pdfs"
 GENERATED_PDF_DIR.mkdir(exist_ok=True)
 
+# NutrientScore inputs (kept float64 so the score matches the unshrunk data)
+SCORE_COLS = ["Protein", "Fibre", "Sugar", "Fat"]
+
+def read_table(csv_path):
+    """Load the Parquet copy of a CSV when step1/step2 wrote one, else the CSV."""
+    parquet_path = csv_path.with_suffix('.parquet')
+    if parquet_path.exists():
+        return pd.read_parquet(parquet_path)
+    return pd.read_csv(csv_path)
+
+def downcast_columns(df, category_cols=(), keep_cols=()):
+    """Shrink numeric columns (float32, smallest int) and repeated labels (category).
+    keep_cols are float64 (widened if step1's Parquet stored them as float32): values
+    returned at full precision or fed into the NutrientScore."""
+    for c in keep_cols:
+        if c in df.columns and df[c].dtype == np.float32:
+            df[c] = widen_float32(df[c])
+    for c in df.select_dtypes(include='float64').columns:
+        if c not in keep_cols:
+            df[c] = df[c].astype('float32')
+    for c in df.select_dtypes(include='int64').columns:
+        df[c] = pd.to_numeric(df[c], downcast='integer')
+    for c in category_cols:
+        if c in df.columns:
+            df[c] = df[c].astype('category')
+    return df
+
 try:
     # 1. Load REAL food data (Unscaled) from parent folder
     food_path = DATA_DIR.parent / "food_master.csv"
-    if food_path.exists():
-        food_df = pd.read_csv(food_path)
+    use_real_food = food_path.exists() or food_path.with_suffix('.parquet').exists()
+    if not use_real_food:
+        # Fallback
+        food_path = DATA_DIR / "food_features.csv"
+
+    # 2. Load all datasets concurrently (the parsers release the GIL)
+    paths = [food_path, DATA_DIR / "exercise_features.csv", DATA_DIR / "medical_guidelines_features.csv"]
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        food_df, exercise_df, medical_df = pool.map(read_table, paths)
+
+    if use_real_food:
         print(f"✅ Food Data Loaded: {len(food_df)} items")
     else:
-        # Fallback
-        food_df = pd.read_csv(DATA_DIR / "food_features.csv")
         print("⚠️ Loaded Scaled Food Data (Fallback)")
-
-    # 2. Load other datasets
-    exercise_df = pd.read_csv(DATA_DIR / "exercise_features.csv")
-    medical_df = pd.read_csv(DATA_DIR / "medical_guidelines_features.csv")
     print("✅ Exercise & Medical Data Loaded")
 
+    food_df = downcast_columns(food_df, ['FoodItem'], keep_cols=SCORE_COLS)
+    exercise_df = downcast_columns(exercise_df, ['Activity'], keep_cols=['Calories_per_kg'])
+    medical_df = downcast_columns(medical_df, ['Condition'])
+
 except Exception as e:
     print(f"❌ Critical Error Loading Data: {e}")
     # Initialize empty DFs to prevent crash
     food_df, exercise_df, medical_df = pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
+# -------------------------
+# PRECOMPUTED FILTER MASKS
+# -------------------------
+# food_df is static, so keyword hits and calorie order are computed once here
+# and request-time filtering is just a few NumPy boolean ANDs.
+NONVEG_KEYWORDS = ['chicken', 'meat', 'fish', 'egg', 'mutton', 'prawn', 'crab']
+
+def split_avoid_tokens(avoid_txt):
+    if not avoid_txt or str(avoid_txt).lower() == 'nan':
+        return []
+    return [x.strip().lower() for x in str(avoid_txt).split(',') if x.strip()]
+
+# NutrientScore weights are constant, so score and rank every item once
+
+if not food_df.empty:
+    for c in SCORE_COLS: food_df[c] = pd.to_numeric(food_df[c], errors='coerce').fillna(0)
+    food_df["NutrientScore"] = (0.4 * food_df["Protein"] + 0.2 * food_df["Fibre"] - 0.1 * food_df["Sugar"] - 0.1 * food_df["Fat"])
+    food_df['Calories'] = pd.to_numeric(food_df['Calories'], errors='coerce')
+
+# Request handlers only read these column arrays (SoA); the DataFrames are
+# dropped so no pandas work happens per request.
+FOOD = {c: food_df[c].to_numpy() for c in food_df.columns}
+EXERCISE = {c: exercise_df[c].to_numpy() for c in exercise_df.columns}
+FOOD_COUNT, EXERCISE_COUNT = len(food_df), len(exercise_df)
+del food_df, exercise_df
+
+# The column arrays are shared by every request, so freeze them: any
+# accidental in-place write fails loudly instead of corrupting later calls.
+for arr in (*FOOD.values(), *EXERCISE.values()):
+    arr.flags.writeable = False
+
+if FOOD_COUNT:
+    score_order = np.argsort(-FOOD["NutrientScore"], kind='stable')
+    food_names_lc = np.array([str(x).lower() if isinstance(x, str) else '' for x in FOOD['FoodItem']], dtype=object)
+    food_calories = FOOD['Calories']
+else:
+    food_names_lc = np.array([], dtype=object)
+    food_calories = np.array([], dtype=float)
+    score_order = np.array([], dtype=np.intp)
+
+# NaN calories sort last, so searchsorted never selects them
+calorie_order = np.argsort(food_calories, kind='stable')
+calories_sorted = food_calories[calorie_order]
+
+if EXERCISE_COUNT:
+    exercise_order = np.argsort(-EXERCISE['Calories_per_kg'].astype(float), kind='stable')
+else:
+    exercise_order = np.array([], dtype=np.intp)
+
+def column_values(arr, idx):
+    col = arr[idx]
+    if col.dtype == np.float32:
+        return widen_float32(col).tolist()
+    return col.tolist()
+
+def to_records(cols, idx):
+    """Build JSON-ready row dicts for the selected indices (NaN -> None)."""
+    # Each column is gathered into Python scalars in one call;
+    # v != v is the scalar NaN check.
+    names = list(cols)
+    columns = [column_values(cols[c], idx) for c in names]
+    return [{c: (None if v != v else v) for c, v in zip(names, vals)} for vals in zip(*columns)]
+
+keyword_mask = {}
+def get_keyword_mask(token):
+    if token not in keyword_mask:
+        mask = np.fromiter((token in s for s in food_names_lc), dtype=bool, count=len(food_names_lc))
+        mask.flags.writeable = False
+        keyword_mask[token] = mask
+    return keyword_mask[token]
+
+nonveg_mask = np.zeros(len(food_names_lc), dtype=bool)
+for tok in NONVEG_KEYWORDS:
+    nonveg_mask |= get_keyword_mask(tok)
+
+# One combined avoid mask per condition (first row wins, like the old lookup),
+# built with a single regex scan of the food names per condition.
+CONDITION_AVOID_MASK = {}
+if not medical_df.empty and {'Condition', 'Avoid'} <= set(medical_df.columns):
+    for cond, avoid_txt in zip(medical_df['Condition'].astype(str), medical_df['Avoid']):
+        cond = cond.lower()
+        if cond in CONDITION_AVOID_MASK:
+            continue
+        tokens = split_avoid_tokens(avoid_txt)
+        if tokens:
+            bad = re.compile('|'.join(map(re.escape, tokens))).search
+            mask = np.fromiter((bad(s) is not None for s in food_names_lc), dtype=bool, count=len(food_names_lc))
+        else:
+            mask = np.zeros(len(food_names_lc), dtype=bool)
+        mask.flags.writeable = False
+        CONDITION_AVOID_MASK[cond] = mask
+
 # -------------------------
 # INPUT SCHEMA
 # -------------------------
@@ -69,6 +212,12 @@ class UserInput(BaseModel):
     diet_pref: str
     condition: str = "None"
 
+# Upper bound on users per /recommend-batch call, so one request can't hold a worker for long
+BATCH_MAX_USERS = 100
+
+class BatchUserInput(BaseModel):
+    users: list[UserInput] = Field(max_length=BATCH_MAX_USERS)
+
 class ChatRequest(BaseModel):
     message: str
     context: dict = {}
@@ -82,21 +231,49 @@ class PdfRequest(BaseModel):
 # -------------------------
 # LOGIC FUNCTIONS
 # -------------------------
+# Activity Factor (Default to 1.375 if unknown)
+ACTIVITY_FACTORS = {0: 1.2, 3: 1.375, 4: 1.55, 5: 1.725, 7: 1.9}
+DEFAULT_ACTIVITY_FACTOR = 1.375
+ACTIVITY_FACTOR_LUT = np.array([ACTIVITY_FACTORS.get(i, DEFAULT_ACTIVITY_FACTOR) for i in range(8)])
+
 def calculate_tdee(age, gender, height, weight, activity_level):
     if str(gender).lower().startswith('m'):
         bmr = 10 * weight + 6.25 * height - 5 * age + 5
     else:
         bmr = 10 * weight + 6.25 * height - 5 * age - 161
 
-    # Activity Factor
-    factors = {0: 1.2, 3: 1.375, 4: 1.55, 5: 1.725, 7: 1.9}
-    # Default to 1.375 if unknown
-    factor = factors.get(activity_level, 1.375)
+    factor = ACTIVITY_FACTORS.get(activity_level, DEFAULT_ACTIVITY_FACTOR)
     return bmr * factor
 
-def get_diet_recommendations(goal, diet_pref, calorie_target, condition):
-    df = food_df.copy()
-    if df.empty: return []
+if HAS_NUMBA:
+    # Serial loop on purpose: handlers run on worker threads, where numba's
+    # parallel threading layer can hang; LLVM still vectorizes this loop.
+    @njit(fastmath=True, cache=True)
+    def tdee_batch_kernel(ages, is_male, heights, weights, activity, lut, default_factor):
+        out = np.empty(ages.shape[0])
+        for i in range(ages.shape[0]):
+            bmr = 10 * weights[i] + 6.25 * heights[i] - 5 * ages[i] + (5.0 if is_male[i] else -161.0)
+            a = activity[i]
+            out[i] = bmr * (lut[a] if 0 <= a < lut.shape[0] else default_factor)
+        return out
+else:
+    def tdee_batch_kernel(ages, is_male, heights, weights, activity, lut, default_factor):
+        bmr = 10 * weights + 6.25 * heights - 5 * ages + np.where(is_male, 5.0, -161.0)
+        in_range = (activity >= 0) & (activity < lut.shape[0])
+        factor = np.where(in_range, lut[np.clip(activity, 0, lut.shape[0] - 1)], default_factor)
+        return bmr * factor
+
+def calculate_tdee_batch(ages, genders, heights, weights, activity_levels):
+    """Vectorized calculate_tdee over equal-length sequences of user fields."""
+    is_male = np.array([str(g).lower().startswith('m') for g in genders], dtype=np.int8)
+    return tdee_batch_kernel(
+        np.asarray(ages, dtype=np.float64), is_male,
+        np.asarray(heights, dtype=np.float64), np.asarray(weights, dtype=np.float64),
+        np.asarray(activity_levels, dtype=np.int64), ACTIVITY_FACTOR_LUT, DEFAULT_ACTIVITY_FACTOR,
+    )
+
+def build_diet_recommendations(goal, diet_pref, calorie_target, condition):
+    if not FOOD_COUNT: return []
 
     # Goal adjustment
     if goal.lower() == "lose weight": target = calorie_target * 0.85
@@ -107,136 +284,203 @@ def get_diet_recommendations(goal, diet_pref, calorie_target, condition):
     lower, upper = meal_target * 0.6, meal_target * 1.4
     
     # Filter by Calorie Range
-    df = df[(df['Calories'] >= lower) & (df['Calories'] <= upper)]
+    keep = np.zeros(FOOD_COUNT, dtype=bool)
+    lo = np.searchsorted(calories_sorted, lower, side='left')
+    hi = np.searchsorted(calories_sorted, upper, side='right')
+    keep[calorie_order[lo:hi]] = True
 
     # Filter by Diet Preference
     if diet_pref.lower() == 'veg':
-        df = df[~df['FoodItem'].str.contains('chicken|meat|fish|egg|mutton|prawn|crab', case=False, na=False)]
+        keep &= ~nonveg_mask
 
     # Filter by Medical Condition
-    if condition and condition != "None" and not medical_df.empty:
-        med_row = medical_df[medical_df['Condition'].str.lower() == condition.lower()]
-        if not med_row.empty:
-            avoid_txt = str(med_row.iloc[0]['Avoid'])
-            if avoid_txt and avoid_txt.lower() != 'nan':
-                avoids = [x.strip() for x in avoid_txt.split(',')]
-                for a in avoids:
-                    if a: df = df[~df['FoodItem'].str.contains(a, case=False, na=False)]
-
-    # Scoring
-    cols = ["Protein", "Fibre", "Sugar", "Fat"]
-    for c in cols: df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-
-    df["NutrientScore"] = (0.4 * df["Protein"] + 0.2 * df["Fibre"] - 0.1 * df["Sugar"] - 0.1 * df["Fat"])
-    
-    # Return top items (Clean NaN values for JSON)
-    top_items = df.sort_values(by="NutrientScore", ascending=False).head(18)
-    
-    # FIX: Convert NaN to None for JSON compatibility
-    return top_items.replace({np.nan: None}).to_dict(orient="records")
+    if condition and condition != "None":
+        avoid_mask = CONDITION_AVOID_MASK.get(condition.lower())
+        if avoid_mask is not None:
+            keep &= ~avoid_mask
 
-def get_exercise_recommendations(goal):
-    ex = exercise_df.copy()
-    if ex.empty: return []
+    # Walk the precomputed score order and keep the first 18 passing items
+    top_idx = score_order[keep[score_order]][:18]
+    return to_records(FOOD, top_idx)
 
-    if goal.lower() == "lose weight": ex = ex[ex['Category'] == 0]
-    elif goal.lower() == "gain weight": ex = ex[ex['Category'] == 1]
-    else: ex = ex[ex['Category'].isin([0, 1])]
+def build_exercise_recommendations(goal):
+    if not EXERCISE_COUNT: return []
 
-    top_ex = ex.sort_values(by='Calories_per_kg', ascending=False).head(7)
+    category = EXERCISE['Category']
+    if goal == "lose weight": keep = category == 0
+    elif goal == "gain weight": keep = category == 1
+    else: keep = (category == 0) | (category == 1)
+
+    top_idx = exercise_order[keep[exercise_order]][:7]
+    top_ex = to_records(EXERCISE, top_idx)
     
     # Add YouTube Links
-    top_ex['YouTubeDemo'] = top_ex['Activity'].apply(
-        lambda x: f"https://www.youtube.com/results?search_query={str(x).replace(' ','+')}"
-    )
-    
-    # FIX: Convert NaN to None for JSON compatibility
-    return top_ex.replace({np.nan: None}).to_dict(orient="records")
+    for row in top_ex:
+        row['YouTubeDemo'] = f"https://www.youtube.com/results?search_query={urllib.parse.quote_plus(str(row['Activity']))}"
+    return top_ex
+
+def frozen_rows(rows):
+    """Read-only views of the row dicts, for answers shared across requests."""
+    return tuple(types.MappingProxyType(r) for r in rows)
+
+def fresh_rows(rows):
+    """A new list of new dicts per response (the values are plain scalars), so a caller
+    that edits its answer can't change what later requests get."""
+    return [dict(r) for r in rows]
+
+# Only calorie_target is continuous, so it is rounded to the nearest bucket
+# and the (small) space of distinct requests is served from an LRU cache.
+DIET_CALORIE_BUCKET = 50  # kcal
+
+@functools.lru_cache(maxsize=4096)
+def cached_diet_recommendations(goal, diet_pref, calorie_bucket, condition):
+    return frozen_rows(build_diet_recommendations(goal, diet_pref, calorie_bucket, condition))
+
+def get_diet_recommendations(goal, diet_pref, calorie_target, condition):
+    bucket = int(round(calorie_target / DIET_CALORIE_BUCKET) * DIET_CALORIE_BUCKET)
+    return fresh_rows(cached_diet_recommendations(goal.lower(), diet_pref.lower(), bucket, condition))
+
+# Exercise picks depend only on the goal and the static exercise data, so the
+# three possible answers are built once at startup.
+EXERCISE_CACHE = {g: frozen_rows(build_exercise_recommendations(g)) for g in ("lose weight", "gain weight", "maintain weight")}
+
+def get_exercise_recommendations(goal):
+    return fresh_rows(EXERCISE_CACHE.get(goal.lower(), EXERCISE_CACHE["maintain weight"]))
+
+# Chatbot keywords per intent, compiled into one pattern. The lookahead lets
+# finditer report a hit at every position, so matching keeps the plain
+# substring semantics of the original `"word" in q` checks.
+CHAT_INTENTS = {
+    "greet": ["hi", "hello", "hey", "hii", "hai"],
+    "bye": ["bye", "goodbye", "see you", "thanks", "thank you"],
+    "what": ["what"],
+    "tdee": ["tdee"],
+    "bmr": ["bmr"],
+    "protein": ["protein"],
+    "fever": ["fever"],
+    "cough": ["cough"],
+    "headache": ["headache"],
+    "lose_weight": ["lose weight", "weight loss"],
+}
+CHAT_INTENT_RE = re.compile("(?=" + "|".join(
+    f"(?P<{intent}>{'|'.join(map(re.escape, words))})" for intent, words in CHAT_INTENTS.items()
+) + ")")
 
 def custom_chatbot_response(query, context):
     q = query.lower().strip()
+    hits = {m.lastgroup for m in CHAT_INTENT_RE.finditer(q)}
     
     # Greetings
-    if any(w in q for w in ["hi", "hello", "hey", "hii", "hai"]):
+    if "greet" in hits:
         name = context.get('name', '')
         if name:
             return f"Hello {name}! 👋 How can I assist you today? You can ask me about TDEE, BMR, diet, exercises, symptoms, or medical conditions."
         return "Hello! 👋 I'm your health assistant. Ask me about TDEE, protein needs, symptoms, or how to use this app!"
     
     # Farewell
-    if any(w in q for w in ["bye", "goodbye", "see you", "thanks", "thank you"]):
+    if "bye" in hits:
         return "You're welcome! Stay healthy and feel free to ask anytime. Take care! 😊"
     
     # What is TDEE?
-    if "what" in q and "tdee" in q:
+    if "what" in hits and "tdee" in hits:
         return "TDEE stands for Total Daily Energy Expenditure. It's the total number of calories you burn in a day, including your BMR (Basal Metabolic Rate) and physical activity."
     
     # What is BMR?
-    if "what" in q and "bmr" in q:
+    if "what" in hits and "bmr" in hits:
         return "BMR (Basal Metabolic Rate) is the number of calories your body needs at rest to maintain basic functions like breathing, circulation, and cell production."
     
     # My TDEE
-    if "my tdee" in q or "tdee" in q:
+    if "tdee" in hits:
         tdee = context.get('tdee')
         if tdee:
             return f"Your estimated TDEE is approximately **{int(tdee)} kcal/day**. This is based on your age, gender, height, weight, and activity level."
         return "I don't have your TDEE yet. Please generate a plan first to calculate it."
     
     # Protein intake
-    if "protein" in q:
+    if "protein" in hits:
         weight = context.get('weight_kg')
         if weight:
             return f"For your weight ({weight} kg), aim for approximately **{round(1.6 * float(weight), 1)}g of protein per day**. Range: 1.2-2.0 g/kg depending on your activity level and goals."
         return "Aim for 1.2–2.0 g of protein per kg of body weight daily. For muscle gain, go higher (1.6-2.0 g/kg)."
     
     # Symptoms
-    if "fever" in q: return "For fever: Rest, stay hydrated, and take paracetamol if needed. Consult a doctor if high fever persists."
-    if "cough" in q: return "For cough: Stay hydrated, use honey or warm water. If persistent, see a healthcare professional."
-    if "headache" in q: return "For headache: Rest in a quiet dark room, stay hydrated. If severe, consult a doctor."
+    if "fever" in hits: return "For fever: Rest, stay hydrated, and take paracetamol if needed. Consult a doctor if high fever persists."
+    if "cough" in hits: return "For cough: Stay hydrated, use honey or warm water. If persistent, see a healthcare professional."
+    if "headache" in hits: return "For headache: Rest in a quiet dark room, stay hydrated. If severe, consult a doctor."
     
     # Weight loss
-    if "lose weight" in q or "weight loss" in q:
+    if "lose_weight" in hits:
         return "For weight loss: Create a calorie deficit (300-500 kcal/day), focus on high-protein and high-fiber foods, do cardio + strength training 4-5 days/week."
     
     # Default fallback
     return ("I'm not sure about that. Try asking me: 'What is TDEE?', 'How much protein should I eat?', 'How to lose weight?', or say 'hi'!")
 
+# Common Unicode characters mapped to ASCII equivalents, applied in one
+# str.translate pass
+SANITIZE_TABLE = str.maketrans({
+    '\u2026': '...',  # Horizontal ellipsis
+    '\u2019': "'",    # Right single quotation mark
+    '\u2018': "'",    # Left single quotation mark
+    '\u201C': '"',    # Left double quotation mark
+    '\u201D': '"',    # Right double quotation mark
+    '\u2013': '-',    # En dash
+    '\u2014': '--',   # Em dash
+    '\u00A0': ' ',   # Non-breaking space
+})
+
 def sanitize_text(text):
     """Convert Unicode text to ASCII-compatible text for FPDF"""
     if not text:
         return ""
-    # Normalize Unicode characters and replace problematic ones
-    text = str(text)
-    # Replace common Unicode characters with ASCII equivalents
-    replacements = {
-        '\u2026': '...',  # Horizontal ellipsis
-        '\u2019': "'",    # Right single quotation mark
-        '\u2018': "'",    # Left single quotation mark
-        '\u201C': '"',    # Left double quotation mark
-        '\u201D': '"',    # Right double quotation mark
-        '\u2013': '-',    # En dash
-        '\u2014': '--',   # Em dash
-        '\u00A0': ' ',   # Non-breaking space
-    }
-    for unicode_char, ascii_char in replacements.items():
-        text = text.replace(unicode_char, ascii_char)
-    # Try to encode as latin-1, replacing any remaining problematic characters
-    try:
-        text = text.encode('latin-1', errors='replace').decode('latin-1')
-    except:
-        # Fallback: remove any remaining non-ASCII characters
-        text = ''.join(char for char in text if ord(char) < 256)
-    return text
+    text = str(text).translate(SANITIZE_TABLE)
+    # Encode as latin-1, replacing any remaining problematic characters
+    return text.encode('latin-1', errors='replace').decode('latin-1')
 
-def generate_pdf_file(user_info, diet_list, exercise_list, tips):
+# -------------------------
+# PDF LAYOUT CONSTANTS
+# -------------------------
+# Static strings are sanitized once; tables are emitted as one pre-formatted
+# Courier block per section instead of one FPDF cell per value.
+PDF_TITLE = sanitize_text("AI-Driven Personalized Diet and Workout Plan")
+PDF_DIET_TITLE = sanitize_text("Diet Recommendations")
+PDF_EXERCISE_TITLE = sanitize_text("Exercise Plan")
+PDF_TIPS_TITLE = sanitize_text("Personalized Tips")
+PDF_NO_DIET = sanitize_text("No diet data available.")
+PDF_NO_EXERCISE = sanitize_text("No exercise data available.")
+
+# Column widths in characters (Courier 9pt is ~1.9mm per character)
+DIET_COL_WIDTHS = [20, 38, 12, 12]
+EXERCISE_COL_WIDTHS = [16, 44, 20]
+
+def format_table_row(widths, values):
+    return "".join(str(v)[:w - 1].ljust(w) for w, v in zip(widths, values))
+
+DIET_TABLE_HEADER = format_table_row(DIET_COL_WIDTHS, ["Meal", "Food Item", "Calories", "Protein"])
+EXERCISE_TABLE_HEADER = format_table_row(EXERCISE_COL_WIDTHS, ["Day", "Workout", "Duration"])
+
+def write_pdf_table(pdf, header, rows):
+    pdf.set_font("Courier", "B", 9)
+    pdf.multi_cell(0, 5, header, border=1)
+    pdf.set_font("Courier", size=9)
+    pdf.multi_cell(0, 5, "\n".join(rows), border=1)
+
+def build_pdf_template():
+    """First page with the static title already laid out."""
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=12)
     pdf.add_page()
     
     # Title
     pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 8, sanitize_text("AI-Driven Personalized Diet and Workout Plan"), ln=True, align="C")
+    pdf.cell(0, 8, PDF_TITLE, ln=True, align="C")
     pdf.ln(4)
+    return pdf
+
+# Built once; each request starts from a deep copy instead of a fresh layout
+PDF_TEMPLATE = build_pdf_template()
+
+def generate_pdf_file(user_info, diet_list, exercise_list, tips):
+    pdf = copy.deepcopy(PDF_TEMPLATE)
     
     # User Info
     pdf.set_font("Arial", size=10)
@@ -249,59 +493,42 @@ def generate_pdf_file(user_info, diet_list, exercise_list, tips):
 
     # Diet Section
     pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 6, sanitize_text("Diet Recommendations"), ln=True)
-    pdf.set_font("Arial", size=9)
+    pdf.cell(0, 6, PDF_DIET_TITLE, ln=True)
     
     if diet_list:
-        # Headers
-        headers = ["Meal", "Food Item", "Calories", "Protein"]
-        col_widths = [40, 80, 25, 25]
-        for i, h in enumerate(headers):
-            pdf.cell(col_widths[i], 6, sanitize_text(h), border=1)
-        pdf.ln()
-        
-        # Rows
+        rows = []
         for item in diet_list[:15]:  # Limit rows for PDF
             meal = sanitize_text(str(item.get('meal', '-')))
             food = sanitize_text(str(item.get('food', item.get('FoodItem', '-'))))[:35]
             calories = str(item.get('calories', item.get('Calories', '0')))
             protein = str(item.get('protein', item.get('Protein', '0')))
-            pdf.cell(col_widths[0], 6, meal, border=1)
-            pdf.cell(col_widths[1], 6, food, border=1)
-            pdf.cell(col_widths[2], 6, calories, border=1)
-            pdf.cell(col_widths[3], 6, protein, border=1)
-            pdf.ln()
+            rows.append(format_table_row(DIET_COL_WIDTHS, [meal, food, calories, protein]))
+        write_pdf_table(pdf, DIET_TABLE_HEADER, rows)
     else:
-        pdf.cell(0, 6, sanitize_text("No diet data available."), ln=True)
+        pdf.set_font("Arial", size=9)
+        pdf.cell(0, 6, PDF_NO_DIET, ln=True)
     pdf.ln(6)
 
     # Exercise Section
     pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 6, sanitize_text("Exercise Plan"), ln=True)
-    pdf.set_font("Arial", size=9)
+    pdf.cell(0, 6, PDF_EXERCISE_TITLE, ln=True)
     
     if exercise_list:
-        headers = ["Day", "Workout", "Duration"]
-        col_widths = [30, 90, 40]
-        for i, h in enumerate(headers):
-            pdf.cell(col_widths[i], 6, sanitize_text(h), border=1)
-        pdf.ln()
-        
+        rows = []
         for item in exercise_list[:10]:
             day = sanitize_text(str(item.get('day', '-')))
             workout = sanitize_text(str(item.get('workout', item.get('Activity', '-'))))[:40]
             duration = sanitize_text(str(item.get('duration', '30 mins')))
-            pdf.cell(col_widths[0], 6, day, border=1)
-            pdf.cell(col_widths[1], 6, workout, border=1)
-            pdf.cell(col_widths[2], 6, duration, border=1)
-            pdf.ln()
+            rows.append(format_table_row(EXERCISE_COL_WIDTHS, [day, workout, duration]))
+        write_pdf_table(pdf, EXERCISE_TABLE_HEADER, rows)
     else:
-        pdf.cell(0, 6, sanitize_text("No exercise data available."), ln=True)
+        pdf.set_font("Arial", size=9)
+        pdf.cell(0, 6, PDF_NO_EXERCISE, ln=True)
     pdf.ln(6)
 
     # Tips Section
     pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 6, sanitize_text("Personalized Tips"), ln=True)
+    pdf.cell(0, 6, PDF_TIPS_TITLE, ln=True)
     pdf.set_font("Arial", size=10)
     for t in tips:
         tip_text = sanitize_text(str(t))
@@ -311,12 +538,29 @@ def generate_pdf_file(user_info, diet_list, exercise_list, tips):
     safe_name = sanitize_text(user_info.get('name', 'user')).replace(' ', '_').replace('.', '')
     filename = f"plan_{safe_name}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
     file_path = GENERATED_PDF_DIR / filename
-    pdf.output(str(file_path))
-    return file_path
+    # Return the bytes; the endpoint does the disk write off the event loop
+    return file_path, pdf.output(dest='S').encode('latin-1')
 
 # -------------------------
 # API ENDPOINTS
 # -------------------------
+def build_recommendation(user, tdee):
+    # 2. Get Diet
+    diet_plan = get_diet_recommendations(user.goal, user.diet_pref, tdee, user.condition)
+    
+    # 3. Get Workout
+    workout_plan = get_exercise_recommendations(user.goal)
+    
+    return {
+        "status": "success",
+        "meta": {
+            "tdee": round(tdee, 2),
+            "goal_calories": round(tdee * (0.85 if user.goal == "Lose Weight" else 1.15 if user.goal == "Gain Weight" else 1), 2)
+        },
+        "diet": diet_plan,
+        "exercises": workout_plan
+    }
+
 @app.post("/recommend")
 async def generate_recommendations(user: UserInput):
     try:
@@ -324,29 +568,31 @@ async def generate_recommendations(user: UserInput):
         # 1. Calculate TDEE
         tdee = calculate_tdee(user.age, user.gender, user.height, user.weight, user.activity_level)
         
-        # 2. Get Diet
-        diet_plan = get_diet_recommendations(user.goal, user.diet_pref, tdee, user.condition)
-        
-        # 3. Get Workout
-        workout_plan = get_exercise_recommendations(user.goal)
-        print(workout_plan)
-        print(diet_plan)
-        
-        return {
-            "status": "success",
-            "meta": {
-                "tdee": round(tdee, 2),
-                "goal_calories": round(tdee * (0.85 if user.goal == "Lose Weight" else 1.15 if user.goal == "Gain Weight" else 1), 2)
-            },
-            "diet": diet_plan,
-            "exercises": workout_plan
-        }
+        result = build_recommendation(user, tdee)
+        print(result["exercises"])
+        print(result["diet"])
+        return result
 
     except Exception as e:
         # Print error to console for debugging
         print(f"Server Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Plain def: FastAPI runs it in the threadpool, so the CPU work stays off the event loop
+@app.post("/recommend-batch")
+def generate_batch_recommendations(batch: BatchUserInput):
+    try:
+        users = batch.users
+        tdees = calculate_tdee_batch(
+            [u.age for u in users], [u.gender for u in users], [u.height for u in users],
+            [u.weight for u in users], [u.activity_level for u in users],
+        )
+        return {"status": "success", "results": [build_recommendation(u, t) for u, t in zip(users, tdees.tolist())]}
+
+    except Exception as e:
+        print(f"Batch Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     try:
@@ -359,12 +605,14 @@ async def chat_endpoint(request: ChatRequest):
 @app.post("/generate-pdf")
 async def pdf_endpoint(request: PdfRequest):
     try:
-        file_path = generate_pdf_file(
+        file_path, pdf_bytes = await asyncio.to_thread(
+            generate_pdf_file,
             request.user_info, 
             request.diet_plan, 
             request.exercise_plan, 
             request.tips
         )
+        await asyncio.to_thread(file_path.write_bytes, pdf_bytes)
         return FileResponse(path=file_path, filename=file_path.name, media_type='application/pdf')
     except Exception as e:
         print(f"PDF Error: {e}")
@@ -372,4 +620,12 @@ async def pdf_endpoint(request: PdfRequest):
 
 if __name__ == "__main__":
     # Ensure this port matches what React is calling (8000)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Workers need the app as an import string; uvloop/httptools are
+    # picked automatically when installed (pip install "uvicorn[standard]").
+    uvicorn.run(
+        "api:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.environ.get("API_WORKERS", os.cpu_count() or 1)),
+    )
\ No newline at end of file
@@ -1,8 +1,16 @@
 import pandas as pd
 import numpy as np
 import os
+import re
 from pathlib import Path
 
+# Optional: pyarrow enables the Parquet copies read by api.py
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except Exception:
+    HAS_PYARROW = False
+
 # -------------------------
 # Config: adjust paths here
 # -------------------------
@@ -31,9 +39,15 @@ def find_file(names):
 # -------------------------
 # Load helper (safe)
 # -------------------------
+def clean_column_names(df):
+    df.columns = [str(c).strip().replace("\u200b","") for c in df.columns]
+    df.columns = [c.replace("\n"," ").strip() for c in df.columns]
+    return df
+
 def safe_read(path, **kwargs):
+    # column names are cleaned once here, on the freshly read frame
     try:
-        return pd.read_csv(path, **kwargs)
+        return clean_column_names(pd.read_csv(path, **kwargs))
     except Exception as e:
         print(f"Warning: couldn't read {path} -> {e}")
         return pd.DataFrame()
@@ -70,20 +84,53 @@ who_rda_df = safe_read(who_rda_path) if who_rda_path else pd.DataFrame()
 # -------------------------
 # 2) Clean / standardize columns
 # -------------------------
-def clean_column_names(df):
+# canonical column name -> accepted source aliases (lowercase, first match wins)
+CANONICAL = {
+    "food_indian": {
+        "FoodItem": ["dish","food items"],
+        "Calories": ["calories"],
+        "Protein": ["protein"],
+        "Carbs": ["carbs"],
+        "Fat": ["fat"],
+        "Fibre": ["fibre"],
+        "Sugar": ["sugar"]
+    },
+    "rda": {
+        "FoodItem": ["food_items"],
+        "VegNonVeg": ["vegnovveg"],
+        "Breakfast": ["breakfast"],
+        "Lunch": ["lunch"],
+        "Dinner": ["dinner"],
+        "Calories": ["calories"]
+    },
+    "met": {
+        "Activity": ["description","actvitiycode"],
+        "MET": ["met"]
+    }
+}
+FOOD_INDIAN_NUTRIENTS = ["Calories","Protein","Carbs","Fat","Fibre","Sugar"]
+
+def canonicalize(df, schema, numeric=(), text=(), required=()):
     df = df.copy()
-    df.columns = [str(c).strip().replace("\u200b","") for c in df.columns]
-    df.columns = [c.replace("\n"," ").strip() for c in df.columns]
+    col_lc = {c.lower():c for c in df.columns}
+    rename_map = {
+        next(col_lc[a] for a in aliases if a in col_lc): target
+        for target, aliases in schema.items()
+        if any(a in col_lc for a in aliases)
+    }
+    df = df.rename(columns=rename_map)
+    for c in required:
+        if c not in df.columns:
+            df[c] = np.nan
+    for c in text:
+        if c in df.columns:
+            df[c] = df[c].astype(str).str.strip()
+    # coerce all numeric columns in one pass
+    num_cols = [c for c in numeric if c in df.columns]
+    if num_cols:
+        df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce')
     return df
 
-exercise_df = clean_column_names(exercise_df)
-food_usda_df = clean_column_names(food_usda_df)
-food_indian_df = clean_column_names(food_indian_df)
-rda_df = clean_column_names(rda_df)
-met_df = clean_column_names(met_df)
-medical_df = clean_column_names(medical_df)
-who_rda_df = clean_column_names(who_rda_df)
-
 # --- Exercise: rename expected columns robustly ---
 def prepare_exercise(df):
     if df.empty:
@@ -119,15 +166,8 @@ exercise_df = prepare_exercise(exercise_df)
 def prepare_met(df):
     if df.empty:
         return df
-    df = df.copy()
-    # possible activity column
-    if 'Description' in df.columns and 'MET' in df.columns:
-        df = df.rename(columns={'Description':'Activity','MET':'MET'})
-    elif 'ActvitiyCode' in df.columns and 'MET' in df.columns:
-        # rename possible misspelling
-        df = df.rename(columns={'ActvitiyCode':'Activity','MET':'MET'})
-    df['Activity'] = df['Activity'].astype(str).str.strip()
-    df['MET'] = pd.to_numeric(df['MET'], errors='coerce').fillna(0)
+    df = canonicalize(df, CANONICAL["met"], numeric=["MET"], text=["Activity"])
+    df['MET'] = df['MET'].fillna(0)
     return df
 
 met_df = prepare_met(met_df)
@@ -135,34 +175,34 @@ met_df = prepare_met(met_df)
 # Link met -> exercise by fuzzy match will be done later if possible
 
 # --- Food (USDA-style): extract key nutrient columns when present
+# heuristics for calories/protein/carbs/fat/sugar/fibre, earlier keywords win
+USDA_KEYWORDS = {
+    "FoodItem": ["description","name","food","category","long_desc"],
+    "Calories": ["energy","calories","energy kcal","kcal"],
+    "Protein": ["protein"],
+    "Carbs": ["carbohydrate","carbs","carbohydrate, by difference"],
+    "Fat": ["total lipid","fat"],
+    "Sugar": ["sugar","sugars","free sugar"],
+    "Fibre": ["fiber","fibre"],
+    "Sodium": ["sodium"],
+    "Calcium": ["calcium"],
+    "Iron": ["iron"],
+    "VitaminC": ["vitamin c","vit c"]
+}
+USDA_PATTERNS = {target: re.compile('|'.join(map(re.escape, keywords)), re.I) for target, keywords in USDA_KEYWORDS.items()}
+USDA_NUTRIENTS = ["Calories","Protein","Carbs","Fat","Sugar","Fibre","Sodium","Calcium","Iron","VitaminC"]
+
 def normalize_food_usda(df):
     if df.empty:
         return df
     df = df.copy()
-    # Lowercase column names map
-    colmap = {c:c for c in df.columns}
-    lc = {c.lower():c for c in df.columns}
-    # heuristics for calories/protein/carbs/fat/sugar/fibre
+    # column names are matched whole (case-insensitive), like the old exact lookup
     picks = {}
-    for target, keywords in {
-        "FoodItem": ["description","name","food","category","long_desc"],
-        "Calories": ["energy","calories","energy kcal","kcal"],
-        "Protein": ["protein"],
-        "Carbs": ["carbohydrate","carbs","carbohydrate, by difference"],
-        "Fat": ["total lipid","fat"],
-        "Sugar": ["sugar","sugars","free sugar"],
-        "Fibre": ["fiber","fibre"],
-        "Sodium": ["sodium"],
-        "Calcium": ["calcium"],
-        "Iron": ["iron"],
-        "VitaminC": ["vitamin c","vit c"]
-    }.items():
-        found = None
-        for k in keywords:
-            if k in lc:
-                found = lc[k]; break
-        if found:
-            picks[target] = found
+    for target, pattern in USDA_PATTERNS.items():
+        matches = [c for c in df.columns if pattern.fullmatch(c)]
+        if matches:
+            keywords = USDA_KEYWORDS[target]
+            picks[target] = min(matches, key=lambda c: keywords.index(c.lower()))
     # create minimal df
     out = pd.DataFrame()
     if "FoodItem" in picks:
@@ -171,11 +211,13 @@ def normalize_food_usda(df):
         # try first text-like column
         text_cols = [c for c in df.columns if df[c].dtype == object]
         out["FoodItem"] = df[text_cols[0]].astype(str).str.strip() if text_cols else "unknown"
-    for nut in ["Calories","Protein","Carbs","Fat","Sugar","Fibre","Sodium","Calcium","Iron","VitaminC"]:
-        if nut in picks:
-            out[nut] = pd.to_numeric(df[picks[nut]], errors='coerce')
-        else:
-            out[nut] = np.nan
+    # coerce all picked nutrient columns in one pass
+    found = [n for n in USDA_NUTRIENTS if n in picks]
+    if found:
+        numeric = df[[picks[n] for n in found]].apply(pd.to_numeric, errors='coerce')
+        numeric.columns = found
+        out = pd.concat([out, numeric], axis=1)
+    out = out.reindex(columns=["FoodItem"] + USDA_NUTRIENTS)
     # drop rows with no FoodItem or all NaNs
     out = out.dropna(subset=["FoodItem"]).reset_index(drop=True)
     return out
@@ -186,30 +228,9 @@ food_usda_core = normalize_food_usda(food_usda_df)
 def prepare_food_indian(df):
     if df.empty:
         return df
-    df = df.copy()
-    # Standardize common columns
-    col_lc = {c.lower():c for c in df.columns}
-    rename_map = {}
-    # possible mappings
-    if 'dish' in col_lc: rename_map[col_lc['dish']] = 'FoodItem'
-    if 'food items' in col_lc: rename_map[col_lc['food items']] = 'FoodItem'
-    if 'calories' in col_lc: rename_map[col_lc['calories']] = 'Calories'
-    if 'protein' in col_lc: rename_map[col_lc['protein']] = 'Protein'
-    if 'carbs' in col_lc: rename_map[col_lc['carbs']] = 'Carbs'
-    if 'fat' in col_lc: rename_map[col_lc['fat']] = 'Fat'
-    if 'fibre' in col_lc: rename_map[col_lc['fibre']] = 'Fibre'
-    if 'sugar' in col_lc: rename_map[col_lc['sugar']] = 'Sugar'
-    # apply
-    df = df.rename(columns=rename_map)
     # keep minimal columns
-    required = ['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar']
-    for c in required:
-        if c not in df.columns:
-            df[c] = np.nan
-    df['FoodItem'] = df['FoodItem'].astype(str).str.strip()
-    # numeric coercion
-    for c in ['Calories','Protein','Carbs','Fat','Fibre','Sugar']:
-        df[c] = pd.to_numeric(df[c], errors='coerce')
+    required = ['FoodItem'] + FOOD_INDIAN_NUTRIENTS
+    df = canonicalize(df, CANONICAL["food_indian"], numeric=FOOD_INDIAN_NUTRIENTS, text=['FoodItem'], required=required)
     return df[required].drop_duplicates(subset=['FoodItem']).reset_index(drop=True)
 
 food_indian_core = prepare_food_indian(food_indian_df)
@@ -218,17 +239,7 @@ food_indian_core = prepare_food_indian(food_indian_df)
 def prepare_rda(df):
     if df.empty:
         return df
-    df = df.copy()
-    # unify names
-    col_lc = {c.lower():c for c in df.columns}
-    rename = {}
-    if 'food_items' in col_lc: rename[col_lc['food_items']] = 'FoodItem'
-    if 'vegnovveg' in col_lc: rename[col_lc['vegnovveg']] = 'VegNonVeg'
-    if 'breakfast' in col_lc: rename[col_lc['breakfast']] = 'Breakfast'
-    if 'lunch' in col_lc: rename[col_lc['lunch']] = 'Lunch'
-    if 'dinner' in col_lc: rename[col_lc['dinner']] = 'Dinner'
-    if 'calories' in col_lc: rename[col_lc['calories']] = 'Calories'
-    df = df.rename(columns=rename)
+    df = canonicalize(df, CANONICAL["rda"], text=['FoodItem'])
     # standardize VegNonVeg: try to map strings to 0/1
     if 'VegNonVeg' in df.columns:
         df['VegNonVeg'] = df['VegNonVeg'].astype(str).str.strip()
@@ -238,9 +249,6 @@ def prepare_rda(df):
             df['VegNonVeg'] = pd.to_numeric(df['VegNonVeg'], errors='coerce')
         except:
             pass
-    # ensure FoodItem text
-    if 'FoodItem' in df.columns:
-        df['FoodItem'] = df['FoodItem'].astype(str).str.strip()
     return df
 
 rda_core = prepare_rda(rda_df)
@@ -350,6 +358,13 @@ exercise_master.to_csv(OUT_DIR / "exercise_master.csv", index=False)
 medical_master.to_csv(OUT_DIR / "medical_guidelines_processed.csv", index=False)
 who_rda_master.to_csv(OUT_DIR / "who_rda_processed.csv", index=False)
 
+# Typed columnar copy of food_master for fast API startup
+if HAS_PYARROW and not food_master.empty:
+    nutrient_cols = [c for c in food_master.columns if c != 'FoodItem']
+    food_parquet = food_master.astype({c: 'float32' for c in nutrient_cols})
+    food_parquet['FoodItem'] = food_parquet['FoodItem'].astype('category')
+    food_parquet.to_parquet(OUT_DIR / "food_master.parquet", compression='zstd', index=False)
+
 print("\nSaved processed files to:", OUT_DIR)
 print("Food master shape:", food_master.shape)
 print("Exercise master shape:", exercise_master.shape)
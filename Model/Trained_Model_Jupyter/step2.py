@@ -4,10 +4,17 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from sklearn.preprocessing import MinMaxScaler
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+# Optional: pyarrow's multithreaded CSV reader, pandas' parser otherwise
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+    HAS_PYARROW = True
+except Exception:
+    HAS_PYARROW = False
+
 
 # -------------------------
 # Path Configuration
@@ -19,10 +26,18 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 # -------------------------
 # Load Processed Files
 # -------------------------
-food_master = pd.read_csv(DATA_DIR / "food_master.csv")
-exercise_master = pd.read_csv(DATA_DIR / "exercise_master.csv")
-medical_df = pd.read_csv(DATA_DIR / "medical_guidelines_processed.csv")
-who_rda_df = pd.read_csv(DATA_DIR / "who_rda_processed.csv")
+def read_csv_fast(path):
+    if HAS_PYARROW:
+        table = pacsv.read_csv(path, read_options=pacsv.ReadOptions(use_threads=True))
+        # all-empty columns come back as Arrow null; pandas reads them as float NaN
+        schema = pa.schema([pa.field(f.name, pa.float64()) if pa.types.is_null(f.type) else f for f in table.schema])
+        return table.cast(schema).to_pandas()
+    return pd.read_csv(path)
+
+food_master = read_csv_fast(DATA_DIR / "food_master.csv")
+exercise_master = read_csv_fast(DATA_DIR / "exercise_master.csv")
+medical_df = read_csv_fast(DATA_DIR / "medical_guidelines_processed.csv")
+who_rda_df = read_csv_fast(DATA_DIR / "who_rda_processed.csv")
 
 print("✅ Datasets Loaded Successfully")
 print(f"Food shape: {food_master.shape}, Exercise shape: {exercise_master.shape}")
@@ -33,21 +48,27 @@ print(f"Food shape: {food_master.shape}, Exercise shape: {exercise_master.shape}
 nutrient_cols = ['Calories', 'Protein', 'Carbs', 'Fat', 'Fibre', 'Sugar']
 food_master[nutrient_cols] = food_master[nutrient_cols].fillna(0)
 
-scaler = MinMaxScaler()
-food_master_scaled = food_master.copy()
-food_master_scaled[nutrient_cols] = scaler.fit_transform(food_master[nutrient_cols])
+# Column-wise min-max scaling in numpy (same as MinMaxScaler, constant columns -> 0),
+# written back in place since the unscaled frame isn't used after this point
+X = food_master[nutrient_cols].to_numpy(dtype=np.float64, copy=True)
+X -= X.min(axis=0)
+span = X.max(axis=0)
+span[span == 0] = 1.0
+X /= span
+food_master[nutrient_cols] = X
 
 # -------------------------
 # Label Encode Category / Type
 # -------------------------
-exercise_master['Category'] = exercise_master['Category'].replace({
-    'Cardio': 0, 'Strength': 1, 'Mixed': 2
-})
+# Categorical codes give Cardio=0, Strength=1, Mixed=2 in one pass (unknown -> -1)
+exercise_master['Category'] = pd.Categorical(
+    exercise_master['Category'], categories=['Cardio', 'Strength', 'Mixed']
+).codes.astype('int8')
 
 # -------------------------
 # Feature Summary Statistics
 # -------------------------
-food_summary = food_master_scaled.describe().T
+food_summary = food_master.describe().T
 exercise_summary = exercise_master.describe().T
 
 print("\n--- Food Nutrient Summary ---")
@@ -58,10 +79,25 @@ print(exercise_summary[['min','max','mean']])
 # -------------------------
 # Save Model-Ready Datasets
 # -------------------------
-food_master_scaled.to_csv(OUT_DIR / "food_features.csv", index=False)
-exercise_master.to_csv(OUT_DIR / "exercise_features.csv", index=False)
-medical_df.to_csv(OUT_DIR / "medical_guidelines_features.csv", index=False)
-who_rda_df.to_csv(OUT_DIR / "who_rda_features.csv", index=False)
+def write_csv_fast(df, path):
+    # Arrow formats and writes in large buffered blocks instead of pandas' row writer
+    if HAS_PYARROW:
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+    else:
+        df.to_csv(path, index=False)
+
+write_csv_fast(food_master, OUT_DIR / "food_features.csv")
+write_csv_fast(exercise_master, OUT_DIR / "exercise_features.csv")
+write_csv_fast(medical_df, OUT_DIR / "medical_guidelines_features.csv")
+write_csv_fast(who_rda_df, OUT_DIR / "who_rda_features.csv")
+
+# Parquet copies (snappy, dictionary-encoded strings): api.py/step3.py read these
+# in place of the CSVs when present, skipping text parsing entirely
+if HAS_PYARROW:
+    food_master.to_parquet(OUT_DIR / "food_features.parquet", compression='snappy', index=False)
+    exercise_master.to_parquet(OUT_DIR / "exercise_features.parquet", compression='snappy', index=False)
+    medical_df.to_parquet(OUT_DIR / "medical_guidelines_features.parquet", compression='snappy', index=False)
+    who_rda_df.to_parquet(OUT_DIR / "who_rda_features.parquet", compression='snappy', index=False)
 
 print("\n✅ Feature Engineering Completed Successfully")
 print(f"Saved model-ready files to: {OUT_DIR}")
@@ -3,7 +3,25 @@
 # ---------------------------------------------------
 import pandas as pd
 import numpy as np
+import re
+import functools
 from pathlib import Path
+from table_utils import widen_float32
+
+# Optional: pyarrow's multithreaded CSV reader, pandas' parser otherwise
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+    HAS_PYARROW = True
+except Exception:
+    HAS_PYARROW = False
+
+# Optional: numba JIT for the TDEE kernels
+try:
+    from numba import njit, vectorize
+    HAS_NUMBA = True
+except Exception:
+    HAS_NUMBA = False
 
 # -------------------------
 # CONFIG: Update this path to match your folder structure exactly!
@@ -14,47 +32,134 @@ DATA_DIR = Path(r"C:\Users\Admin\OneDrive\Desktop\COLLEGE_WORK\EDI_Prj_Code\DS\N
 # -------------------------
 # FIX: Load UN-SCALED food data for human-readable recommendations
 # -------------------------
+def read_csv_fast(path):
+    if HAS_PYARROW:
+        table = pacsv.read_csv(path, read_options=pacsv.ReadOptions(use_threads=True))
+        # all-empty columns come back as Arrow null; pandas reads them as float NaN
+        schema = pa.schema([pa.field(f.name, pa.float64()) if pa.types.is_null(f.type) else f for f in table.schema])
+        return table.cast(schema).to_pandas()
+    return pd.read_csv(path)
+
+def read_table(csv_path, columns=None):
+    # Parquet copy written by step1/step2 when present (only the needed columns), else the CSV
+    parquet_path = csv_path.with_suffix('.parquet')
+    if HAS_PYARROW and parquet_path.exists():
+        return pd.read_parquet(parquet_path, columns=columns)
+    df = read_csv_fast(csv_path)
+    return df[columns] if columns else df
+
 # We look for food_master.csv in the PARENT folder of model_ready (updtaed_new)
 food_master_path = DATA_DIR.parent / "food_master.csv"
+FOOD_COLS = ['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar']
 
-if food_master_path.exists():
-    food_df = pd.read_csv(food_master_path)
+if food_master_path.exists() or food_master_path.with_suffix('.parquet').exists():
+    food_df = read_table(food_master_path, FOOD_COLS)
     print(f"✅ Loaded REAL food data from: {food_master_path}")
 else:
     # If not found, warn the user
     print(f"⚠️ Warning: Could not find 'food_master.csv' at {food_master_path}")
     print("Attempting to load features file (Warning: values might be scaled 0-1 and return empty results!)")
-    food_df = pd.read_csv(DATA_DIR / "food_features.csv")
+    food_df = read_table(DATA_DIR / "food_features.csv", FOOD_COLS)
+
+# step1's Parquet copy stores nutrients as float32; widen them back to the short decimals
+f32_cols = food_df.select_dtypes(include='float32').columns
+food_df[f32_cols] = widen_float32(food_df[f32_cols])
 
 # Load other files (Exercise data doesn't use calorie scaling for filtering, so features file is fine)
-exercise_df = pd.read_csv(DATA_DIR / "exercise_features.csv")
-medical_df = pd.read_csv(DATA_DIR / "medical_guidelines_features.csv")
+exercise_df = read_table(DATA_DIR / "exercise_features.csv")
+medical_df = read_table(DATA_DIR / "medical_guidelines_features.csv")
 
 print("✅ All datasets loaded successfully!")
 
+# Score inputs are coerced once here and kept as a float32 matrix for scoring
+SCORE_COLS = ["Protein", "Fibre", "Sugar", "Fat"]
+SCORE_WEIGHTS = np.array([0.4, 0.2, -0.1, -0.1], dtype=np.float32)
+food_df[SCORE_COLS] = food_df[SCORE_COLS].apply(pd.to_numeric, errors='coerce').fillna(0)
+food_nutrients = food_df[SCORE_COLS].to_numpy(dtype=np.float32)
+food_calories = food_df['Calories'].to_numpy(dtype=np.float32)
+
+# Display columns as plain arrays; results are rebuilt from the selected rows only
+FOOD = {c: food_df[c].to_numpy() for c in FOOD_COLS}
+
+# Lowercased names as a Categorical: patterns are matched once per distinct name
+# (plain compiled regex over a list comp, case-sensitive since names are folded here)
+# and the per-row mask is gathered through the codes
+food_name_cat = pd.Categorical(food_df['FoodItem'].fillna('').astype(str).str.lower())
+food_names = tuple(food_name_cat.categories)
+food_name_codes = np.asarray(food_name_cat.codes)
+
+def regex_mask(rgx):
+    hits = np.fromiter((rgx.search(n) is not None for n in food_names), dtype=bool, count=len(food_names))
+    return hits[food_name_codes]
+
+# The non-veg filter doesn't depend on the user, so its mask is built once
+NONVEG_KEYWORDS = ['chicken','meat','fish','egg','mutton','prawn','crab','bacon','sausage']
+nonveg_mask = regex_mask(re.compile('|'.join(NONVEG_KEYWORDS)))
+
+# Each condition's Avoid list compiled once into a single lowercase alternation (first row wins)
+condition_avoid_re = {}
+for cond, avoid_txt in zip(medical_df['Condition'].astype(str), medical_df['Avoid'].astype(str)):
+    avoids = [x.strip().lower() for x in avoid_txt.split(',') if x.strip()]
+    if avoid_txt.lower() != 'nan' and avoids:
+        condition_avoid_re.setdefault(cond.lower(), re.compile('|'.join(map(re.escape, avoids))))
+
+# The exercise catalogue is static, so its YouTube search links are built once
+YOUTUBE_SEARCH_URL = "https://www.youtube.com/results?search_query="
+exercise_df['YouTubeDemo'] = YOUTUBE_SEARCH_URL + exercise_df['Activity'].astype(str).str.replace(' ', '+', regex=False)
+EXERCISE_COLS = ['Activity','Calories_per_kg','Category','YouTubeDemo']
+EXERCISE = {c: exercise_df[c].to_numpy() for c in EXERCISE_COLS}
+
 # -------------------------
 # Utility Functions
 # -------------------------
-def calculate_tdee(age, gender, height, weight, activity_level):
-    if str(gender).lower().startswith('m'):
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
+def top_k_desc(values, k):
+    # positions of the k largest values, largest first; O(N) selection then a k-sized sort
+    if len(values) <= k:
+        return np.argsort(-values, kind='stable')
+    part = np.argpartition(-values, k)[:k]
+    return part[np.lexsort((part, -values[part]))]
+
+# Activity factor by level, shifted by one so negative levels land on slot 0:
+# <0 -> 1.375, 0 -> 1.2, 1-3 -> 1.375, 4-5 -> 1.55, 6+ -> 1.725 (levels are clamped to [-1, 6])
+ACTIVITY_FACTOR_LUT = np.array([1.375, 1.2, 1.375, 1.375, 1.375, 1.55, 1.55, 1.725])
+
+def tdee_kernel(age, is_male, height, weight, activity_level):
+    bmr = 10 * weight + 6.25 * height - 5 * age + (5.0 if is_male else -161.0)
+    factor = ACTIVITY_FACTOR_LUT[min(max(activity_level, -1), 6) + 1]
+    return bmr * factor
 
-    # Activity Factor
-    if activity_level == 0: factor = 1.2
-    elif activity_level <= 3: factor = 1.375
-    elif activity_level <= 5: factor = 1.55
-    else: factor = 1.725
+def tdee_batch_numpy(ages, is_male, heights, weights, activity_levels):
+    bmr = 10 * weights + 6.25 * heights - 5 * ages + np.where(is_male, 5.0, -161.0)
+    factor = ACTIVITY_FACTOR_LUT[np.clip(activity_levels, -1, 6) + 1]
     return bmr * factor
 
-def recommend_diet(goal, diet_pref, calorie_target, condition=None):
-    df = food_df.copy()
+if HAS_NUMBA:
+    # same scalar kernel, compiled once for single users and as a ufunc for cohorts
+    tdee_batch_kernel = vectorize(['float64(float64, boolean, float64, float64, int64)'], cache=True)(tdee_kernel)
+    tdee_kernel = njit(cache=True)(tdee_kernel)
+else:
+    tdee_batch_kernel = tdee_batch_numpy
+
+def calculate_tdee(age, gender, height, weight, activity_level):
+    is_male = str(gender).lower().startswith('m')
+    return tdee_kernel(float(age), is_male, float(height), float(weight), int(activity_level))
+
+def calculate_tdee_batch(ages, genders, heights, weights, activity_levels):
+    # gender strings are parsed once here, before the numeric kernel
+    is_male = np.array([str(g).lower().startswith('m') for g in genders], dtype=bool)
+    return tdee_batch_kernel(
+        np.asarray(ages, dtype=np.float64), is_male,
+        np.asarray(heights, dtype=np.float64), np.asarray(weights, dtype=np.float64),
+        np.asarray(activity_levels, dtype=np.int64),
+    )
 
+@functools.lru_cache(maxsize=4096)
+def top_food_indices(goal, diet_pref, calorie_target, condition):
+    # goal/diet_pref/condition arrive lowercased; returns row positions of the top 10
     # 1. Goal-based calorie adjustment
-    if goal.lower() == "lose weight":
+    if goal == "lose weight":
         target = calorie_target * 0.85
-    elif goal.lower() == "gain weight":
+    elif goal == "gain weight":
         target = calorie_target * 1.15
     else:
         target = calorie_target
@@ -65,61 +170,50 @@ def recommend_diet(goal, diet_pref, calorie_target, condition=None):
     lower, upper = meal_target * 0.6, meal_target * 1.4
     
     # Filter by calories (Using REAL numbers now)
-    df = df[(df['Calories'] >= lower) & (df['Calories'] <= upper)]
+    # Each stage ANDs into one row mask over the precomputed arrays
+    keep = (food_calories >= lower) & (food_calories <= upper)
 
     # 2. Diet preference
-    if diet_pref.lower() == 'veg':
-        # Filter out non-veg items based on keywords
-        df = df[~df['FoodItem'].str.contains('chicken|meat|fish|egg|mutton|prawn|crab|bacon|sausage', case=False, na=False)]
+    if diet_pref == 'veg':
+        keep &= ~nonveg_mask
 
     # 3. Medical Conditions
-    if condition and not medical_df.empty:
-        # Simple lookup in medical rules
-        med_row = medical_df[medical_df['Condition'].str.lower() == condition.lower()]
-        if not med_row.empty:
-            avoid_txt = str(med_row.iloc[0]['Avoid'])
-            if avoid_txt and avoid_txt.lower() != 'nan':
-                # Split by comma and filter out
-                avoids = [x.strip() for x in avoid_txt.split(',')]
-                for a in avoids:
-                    if a:
-                        df = df[~df['FoodItem'].str.contains(a, case=False, na=False)]
+    avoid_re = condition_avoid_re.get(condition) if condition else None
+    if avoid_re is not None:
+        keep &= ~regex_mask(avoid_re)
 
     # 4. Rank by score
-    # Ensure columns are numeric
-    for col in ["Protein", "Fibre", "Sugar", "Fat"]:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-    df["NutrientScore"] = (
-        0.4 * df["Protein"] + 
-        0.2 * df["Fibre"] - 
-        0.1 * df["Sugar"] - 
-        0.1 * df["Fat"]
-    )
-    
-    # Return top 10
-    return df.sort_values(by="NutrientScore", ascending=False).head(10)[['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar']]
+    idx = np.flatnonzero(keep)
+    scores = food_nutrients[idx] @ SCORE_WEIGHTS
+
+    # Top 10
+    return tuple(idx[top_k_desc(scores, 10)].tolist())
+
+# Only calorie_target is continuous, so it is rounded to the nearest bucket and
+# the small space of distinct requests is answered from the LRU cache above
+DIET_CALORIE_BUCKET = 50  # kcal
+
+def recommend_diet(goal, diet_pref, calorie_target, condition=None):
+    bucket = int(round(calorie_target / DIET_CALORIE_BUCKET) * DIET_CALORIE_BUCKET)
+    top = list(top_food_indices(goal.lower(), diet_pref.lower(), bucket, condition.lower() if condition else None))
+    return pd.DataFrame({c: FOOD[c][top] for c in FOOD_COLS})
 
 
 def recommend_exercises(goal):
-    ex = exercise_df.copy()
+    category = EXERCISE['Category']
     
     # Category mapping: 0=Cardio, 1=Strength, 2=Mixed
     if goal.lower() == "lose weight":
-        ex = ex[ex['Category'] == 0]
+        keep = category == 0
     elif goal.lower() == "gain weight":
-        ex = ex[ex['Category'] == 1]
+        keep = category == 1
     else:
-        ex = ex[ex['Category'].isin([0, 1])]
-
-    ex = ex.sort_values(by='Calories_per_kg', ascending=False).head(5)
-    
-    # Add YouTube links
-    ex['YouTubeDemo'] = ex['Activity'].apply(
-        lambda x: f"https://www.youtube.com/results?search_query={str(x).replace(' ','+')}"
-    )
+        keep = (category == 0) | (category == 1)
 
-    return ex[['Activity','Calories_per_kg','Category','YouTubeDemo']]
+    # Output is built straight from the selected rows, no intermediate frames
+    idx = np.flatnonzero(keep)
+    top = idx[top_k_desc(EXERCISE['Calories_per_kg'][idx], 5)]
+    return pd.DataFrame({c: EXERCISE[c][top] for c in EXERCISE_COLS})
 
 # -------------------------
 # Run Test
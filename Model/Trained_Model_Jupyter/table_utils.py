@@ -0,0 +1,7 @@
+import numpy as np
+
+
+def widen_float32(values):
+    """float32 values (array, Series or DataFrame) as float64 via their shortest decimal text,
+    so a stored 380.91 comes back as 380.91 rather than 380.9100036621094."""
+    return values.astype(str).astype(np.float64)
@@ -3,16 +3,26 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json
+import functools
+import hashlib
+import re
 import datetime
-from fpdf import FPDF # pip install fpdf
+import collections
+import itertools
+import time
 import urllib.parse
-
-# Optional OpenAI usage flag (safe import)
-try:
-    import openai
-    HAS_OPENAI = True
-except Exception:
-    HAS_OPENAI = False
+import importlib.util
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional OpenAI usage flag (only checks availability; the module is imported when the chatbot uses it)
+HAS_OPENAI = importlib.util.find_spec('openai') is not None
+# Optional pyahocorasick for long medical avoid lists (escaped regex alternation otherwise)
+HAS_AHOCORASICK = importlib.util.find_spec('ahocorasick') is not None
+# Optional tiktoken for counting chat prompt tokens before they are sent
+HAS_TIKTOKEN = importlib.util.find_spec('tiktoken') is not None
 
 # --- Start: UI/Style Helper Function (Kept as per user request) ---
 def add_bg_and_style():
@@ -105,42 +115,139 @@ EXERCISE_VIDEOS_FILE = DATA_DIR / "exercise_videos.csv"
 # ---------------------------
 # Helper Functions
 # ---------------------------
+# Parsed once per file version: the mtime in the key invalidates the cache when a CSV changes
+@st.cache_data(show_spinner=False, persist="disk")
+def load_csv(p_str: str, mtime: float):
+    try:
+        return pd.read_csv(p_str)
+    except Exception as e:
+        st.error(f"Error reading {Path(p_str).name}: {e}")
+        return pd.DataFrame()
+
 def safe_read_csv(p: Path):
     if p.exists():
-        try:
-            return pd.read_csv(p)
-        except Exception as e:
-            st.error(f"Error reading {p.name}: {e}")
-            return pd.DataFrame()
+        return load_csv(str(p), p.stat().st_mtime)
     else:
         return pd.DataFrame()
 
-def tdee_bmr(age, gender, height_cm, weight_kg, activity_days):
-    if str(gender).lower().startswith("m"):
-        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
-    else:
-        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
-    if activity_days == 0:
-        af = 1.2
-    elif activity_days <= 3:
-        af = 1.375
-    elif activity_days <= 5:
-        af = 1.55
-    else:
-        af = 1.725
-    return bmr * af
+def get_col(df, keys):
+    lc = [c.lower() for c in df.columns]
+    for k in keys:
+        if k in lc:
+            return df.columns[lc.index(k)]
+    return None
+
+FOOD_NUMERIC_KEYS = [('Calories', ['calories','energy','kcal']), ('Protein', ['protein']),
+                     ('Carbs', ['carb','carbs','carbohydrate']), ('Fat', ['fat']),
+                     ('Fibre', ['fibre','fiber']), ('Sugar', ['sugar'])]
+
+@st.cache_data(show_spinner=False)
+def prepare_foods(p_str: str, mtime: float):
+    foods = load_csv(p_str, mtime)  # cache_data hands back its own copy
+    name_col = get_col(foods, ['fooditem','dish','description','name','food'])
+    foods['FoodItem'] = foods[name_col] if name_col else foods.iloc[:,0]
+    for cname, keys in FOOD_NUMERIC_KEYS:
+        src = get_col(foods, keys)
+        foods[cname] = pd.to_numeric(foods[src], errors='coerce').fillna(0) if src else 0.0
+    # Only the name and the normalized nutrients are ever filtered, scored or shown; the raw
+    # source columns (Sodium, Iron, the original name/energy columns, ...) are dropped here
+    return foods[['FoodItem'] + [c for c, _ in FOOD_NUMERIC_KEYS]]
 
 def make_youtube_search_link(name):
     q = urllib.parse.quote_plus(name)
     return f"https://www.youtube.com/results?search_query={q}"
 
+@st.cache_data(show_spinner=False)
+def prepare_exercises(p_str: str, mtime: float):
+    # Returns the normalized exercise table, cardio/strength masks (Category lowercased once)
+    # and {Activity: YouTube search link}, so links are encoded once per file version
+    ex = load_csv(p_str, mtime)  # cache_data hands back its own copy
+    if 'Activity' not in ex.columns:
+        ex.rename(columns={ex.columns[0]:'Activity'}, inplace=True)
+    if 'Calories_per_kg' not in ex.columns:
+        ex['Calories_per_kg'] = pd.to_numeric(ex['MET'], errors='coerce')*1.05 if 'MET' in ex.columns else 0.0
+    if 'Category' not in ex.columns:
+        ex['Category'] = 'Mixed'
+    ex['Calories_per_kg'] = pd.to_numeric(ex['Calories_per_kg'], errors='coerce').fillna(0)
+    cat_lower = ex['Category'].astype(str).str.lower()
+    demo_links = {a: make_youtube_search_link(str(a)) for a in ex['Activity'].unique()}
+    return ex, cat_lower.str.contains('cardio').to_numpy(), cat_lower.str.contains('strength').to_numpy(), demo_links
+
+@st.cache_data(show_spinner=False)
+def load_veg_map(p_str: str, mtime: float):
+    # {FoodItem: VegNonVeg} with VegNonVeg numeric (0=Veg, 1=NonVeg); None if the columns are missing
+    rda = load_csv(p_str, mtime)
+    if not {'FoodItem','VegNonVeg'}.issubset(rda.columns):
+        return None
+    return dict(zip(rda['FoodItem'], pd.to_numeric(rda['VegNonVeg'], errors='coerce')))
+
+@st.cache_data(show_spinner=False)
+def get_medical_conditions(p_str: str, mtime: float):
+    # keyed on the file version like load_csv, so a rerun doesn't hash the whole table
+    return load_csv(p_str, mtime)['Condition'].unique().tolist()
+
+# Seed for the diversity sampling below; each draw gets its own generator, so the same inputs
+# give the same picks and the exercise picks don't depend on how much the diet draw consumed
+SAMPLE_SEED = 42
+
+# Activity factor by workout days/week (0 -> 1.2, 1-3 -> 1.375, 4-5 -> 1.55, 6-7 -> 1.725)
+AF_TABLE = np.array([1.2, 1.375, 1.375, 1.375, 1.55, 1.55, 1.725, 1.725])
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def tdee_bmr(age, gender, height_cm, weight_kg, activity_days):
+    is_male = str(gender).lower().startswith("m")
+    bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + (5 if is_male else -161)
+    af = AF_TABLE[min(max(int(activity_days), 0), len(AF_TABLE) - 1)]
+    return float(bmr * af)
+
+# Below this many avoid tokens the regex alternation is as fast as the automaton
+AHOCORASICK_MIN_TOKENS = 20
+
+@st.cache_resource(show_spinner=False)
+def get_avoid_automaton(tokens: tuple):
+    # One Aho-Corasick automaton per avoid list, reused across reruns and sessions
+    import ahocorasick
+    automaton = ahocorasick.Automaton()
+    for t in tokens:
+        automaton.add_word(t, t)
+    automaton.make_automaton()
+    return automaton
+
+@st.cache_resource
+def get_pdf_pool():
+    # One small worker pool shared across reruns/sessions for PDF generation
+    return ThreadPoolExecutor(max_workers=2)
+
 # --- Start: PDF Generation Update for Clickable Links ---
+PDF_TITLE = "AI-Driven Personalized Diet and Workout Recommendation"
+PDF_DISCLAIMER = "Disclaimer: This is an AI-based suggestion intended for general purpose only. For medical conditions, consult a certified health professional."
+PDF_DIET_COLW = [60, 22, 22, 22, 22, 22] # mm
+# Columns for PDF: Activity, Category, Cal/kg, Est_Cals_session, Demo Link
+PDF_EX_HEADERS = ['Activity', 'Category', 'Cal/kg', 'Est_kcal/session', 'Demo Link']
+PDF_EX_COLW = [40, 35, 30, 30, 55] # mm, adjusted width for new 'Demo Link' column
+PDF_LINK_TEXT = "Watch Demo"
+
+def pdf_diet_rows(diet_table):
+    # Header labels plus all cell strings, formatted and truncated up front
+    # (plain Python over row tuples: pandas per-column ops cost more than the ~20 rows here)
+    headers = list(diet_table.columns[:6])
+    rows = diet_table.head(20)[headers].itertuples(index=False, name=None)
+    return [str(h) for h in headers], [[str(v)[:25] for v in r] for r in rows]
+
+def pdf_exercise_rows(exercise_table):
+    # (activity, category, cal/kg, kcal/session, link url) per row
+    ex10 = exercise_table.head(10) # Use head(10) to match display_ex
+    cols = zip(ex10['Activity'].tolist(), ex10['Category'].tolist(), ex10['Calories_per_kg'].tolist(),
+               ex10['Est_Cals_session'].tolist(), ex10['demo_link'].tolist())
+    return [(str(a)[:25], str(c)[:15], f"{ckg:.2f}", str(int(est)), str(url)) for a, c, ckg, est, url in cols]
+
 def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
+    from fpdf import FPDF # pip install fpdf (imported on first PDF, not on every rerun)
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=12)
     pdf.add_page()
     pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 8, "AI-Driven Personalized Diet and Workout Recommendation", ln=True, align="C")
+    pdf.cell(0, 8, PDF_TITLE, ln=True, align="C")
     pdf.ln(4)
     pdf.set_font("Arial", size=10)
     pdf.multi_cell(0, 6, f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -152,15 +259,10 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     pdf.cell(0, 6, "Diet Recommendations (per meal approx.)", ln=True)
     pdf.set_font("Arial", size=9)
     if not diet_table.empty:
-        colw = [60, 22, 22, 22, 22, 22]
-        headers = list(diet_table.columns[:6])
-        for i, h in enumerate(headers):
-            pdf.cell(colw[i], 6, str(h), border=1)
-        pdf.ln()
-        for _, r in diet_table.head(20).iterrows():
-            vals = [str(r.get(c,"")) for c in headers]
-            for i,v in enumerate(vals):
-                pdf.cell(colw[i], 6, v[:25], border=1)
+        headers, rows = pdf_diet_rows(diet_table)
+        for vals in [headers] + rows:
+            for w, v in zip(PDF_DIET_COLW, vals):
+                pdf.cell(w, 6, v, border=1)
             pdf.ln()
     else:
         pdf.cell(0, 6, "No diet recommendations found.", ln=True)
@@ -171,35 +273,22 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     pdf.cell(0, 6, "Exercise Recommendations (Top)", ln=True)
     pdf.set_font("Arial", size=9)
     if not exercise_table.empty:
-        # Columns for PDF: Activity, Category, Cal/kg, Est_Cals_session, Demo Link
-        headers = ['Activity','Category','Calories_per_kg','Est_Cals_session','demo_link']
-        colw_ex = [40, 35, 30, 30, 55] # Adjusted width for new 'Demo Link' column
+        colw_ex = PDF_EX_COLW
 
-        # Print headers
-        for h in ['Activity', 'Category', 'Cal/kg', 'Est_kcal/session', 'Demo Link']:
-            pdf.cell(colw_ex[headers.index(h)], 6, str(h), border=1)
+        # Print headers (display labels paired with the column widths)
+        for w, h in zip(colw_ex, PDF_EX_HEADERS):
+            pdf.cell(w, 6, h, border=1)
         pdf.ln()
 
-        # Print data rows
-        for _, r in exercise_table.head(10).iterrows(): # Use head(10) to match display_ex
-            # Activity
-            pdf.cell(colw_ex[0], 6, str(r['Activity'])[:25], border=1)
-            # Category
-            pdf.cell(colw_ex[1], 6, str(r['Category'])[:15], border=1)
-            # Calories_per_kg
-            pdf.cell(colw_ex[2], 6, f"{r['Calories_per_kg']:.2f}", border=1)
-            # Est_Cals_session
-            pdf.cell(colw_ex[3], 6, f"{int(r['Est_Cals_session'])}", border=1)
+        for activity, category, cal_kg, est_cals, link_url in pdf_exercise_rows(exercise_table):
+            pdf.cell(colw_ex[0], 6, activity, border=1)
+            pdf.cell(colw_ex[1], 6, category, border=1)
+            pdf.cell(colw_ex[2], 6, cal_kg, border=1)
+            pdf.cell(colw_ex[3], 6, est_cals, border=1)
             # Demo Link (Text and Link)
-            link_text = "Watch Demo"
-            link_url = str(r['demo_link'])
-            
-            # Set cursor to start of cell for link
-            x, y = pdf.get_x(), pdf.get_y()
             pdf.set_text_color(0, 0, 255) # Blue color for link
-            pdf.cell(colw_ex[4], 6, link_text, border=1, link=link_url, align='C')
+            pdf.cell(colw_ex[4], 6, PDF_LINK_TEXT, border=1, link=link_url, align='C')
             pdf.set_text_color(0, 0, 0) # Reset color
-            
             pdf.ln()
     else:
         pdf.cell(0, 6, "No exercise recommendations found.", ln=True)
@@ -215,7 +304,7 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     
     # Disclaimer
     pdf.set_font("Arial", size=7)
-    pdf.multi_cell(0, 5, "Disclaimer: This is an AI-based suggestion intended for general purpose only. For medical conditions, consult a certified health professional.")
+    pdf.multi_cell(0, 5, PDF_DISCLAIMER)
     pdf.output(str(out_path))
     return out_path
 # --- End: PDF Generation Update for Clickable Links ---
@@ -248,7 +337,7 @@ with col2:
     workout_freq = st.slider("Workout Frequency (days/week) *", 0, 7, 0)
     diet_pref = st.selectbox("Diet Preference *", ["Select Preference", "Veg", "NonVeg"])
 
-med_condition = st.selectbox("Medical condition (optional)", ["None"] + list(medical_df['Condition'].unique()) if not medical_df.empty else ["None"])
+med_condition = st.selectbox("Medical condition (optional)", ["None"] + get_medical_conditions(str(MEDICAL_FILE), MEDICAL_FILE.stat().st_mtime) if not medical_df.empty else ["None"])
 
 # --- Start: Chatbot OpenAI Key Input (Moved from recommendation button block) ---
 openai_key = st.text_input("🔑 Paste OpenAI API Key here (optional for enhanced chatbot)", type="password")
@@ -312,49 +401,23 @@ if st.session_state['recommendation_clicked']:
     
     st.success(f"### 🎯 Estimated daily calorie target: **{int(calorie_target)} kcal**")
 
-    # Diet processing
-    cols = [c.lower() for c in food_df.columns]
-    name_col = None
-    for cand in ['fooditem','dish','description','name','food']:
-        if cand in cols:
-            name_col = food_df.columns[cols.index(cand)]
-            break
-
-    def get_col(df, keys):
-        lc = [c.lower() for c in df.columns]
-        for k in keys:
-            if k in lc:
-                return df.columns[lc.index(k)]
-        return None
-
-    cal_col = get_col(food_df, ['calories','energy','kcal'])
-    prot_col = get_col(food_df, ['protein'])
-    carbs_col = get_col(food_df, ['carb','carbs','carbohydrate'])
-    fat_col = get_col(food_df, ['fat'])
-    fibre_col = get_col(food_df, ['fibre','fiber'])
-    sugar_col = get_col(food_df, ['sugar'])
-
-    foods = food_df.copy()
-    foods['FoodItem'] = foods[name_col] if name_col else foods.iloc[:,0]
-    for (cname, src) in [('Calories',cal_col), ('Protein',prot_col), ('Carbs',carbs_col), ('Fat',fat_col), ('Fibre',fibre_col), ('Sugar',sugar_col)]:
-        foods[cname] = pd.to_numeric(foods[src], errors='coerce').fillna(0) if src else 0.0
+    # Diet processing (column resolution + numeric coercion cached per food file version)
+    foods = prepare_foods(str(FOOD_MASTER_FILE), FOOD_MASTER_FILE.stat().st_mtime)
 
     # --- Start: Fixed Veg/NonVeg filtering logic ---
-    filtered_foods = foods.copy()
+    filtered_foods = foods
     rda_path = DATA_DIR / "rda_cleaned.csv"
     if rda_path.exists():
-        rda_df_local = safe_read_csv(rda_path)
-        # Ensure columns exist and the VegNonVeg column is numeric (0=Veg, 1=NonVeg)
-        if {'FoodItem','VegNonVeg'}.issubset(rda_df_local.columns):
-            rda_df_local['VegNonVeg'] = pd.to_numeric(rda_df_local['VegNonVeg'], errors='coerce')
-            merged = pd.merge(filtered_foods, rda_df_local[['FoodItem','VegNonVeg']].drop_duplicates(), on='FoodItem', how='left')
+        veg_map = load_veg_map(str(rda_path), rda_path.stat().st_mtime)
+        if veg_map is not None:
+            veg = filtered_foods['FoodItem'].map(veg_map)
             
             if diet_pref == 'Veg':
                 # Keep Veg (0) or items with no category (NaN) - Safe fallback
-                filtered_foods = merged[(merged['VegNonVeg'].isna()) | (merged['VegNonVeg'] == 0)]
+                filtered_foods = filtered_foods[veg.isna() | (veg == 0)]
             elif diet_pref == 'NonVeg':
                 # Keep NonVeg (1) or items with no category (NaN) - Safe fallback
-                filtered_foods = merged[(merged['VegNonVeg'].isna()) | (merged['VegNonVeg'] == 1)]
+                filtered_foods = filtered_foods[veg.isna() | (veg == 1)]
     
     # --- End: Fixed Veg/NonVeg filtering logic ---
 
@@ -364,7 +427,17 @@ if st.session_state['recommendation_clicked']:
         if not row.empty:
             avoid_text = str(row.iloc[0].get('Avoid',''))
             avoid_tokens = [t.strip().lower() for t in avoid_text.split(',') if t.strip()]
-            filtered_foods = filtered_foods[~filtered_foods['FoodItem'].astype(str).str.lower().apply(lambda x: any(tok in x for tok in avoid_tokens))]
+            if HAS_AHOCORASICK and len(avoid_tokens) >= AHOCORASICK_MIN_TOKENS:
+                # long lists: each lowercased name is scanned once by the automaton, whatever the token count
+                automaton = get_avoid_automaton(tuple(avoid_tokens))
+                names = filtered_foods['FoodItem'].fillna('').astype(str).str.lower().tolist()
+                mask = np.fromiter((next(automaton.iter(n), None) is not None for n in names), dtype=bool, count=len(names))
+                filtered_foods = filtered_foods[~mask]
+            elif avoid_tokens:
+                # one escaped alternation = "any token is a substring", scanned in a single pass
+                pattern = '|'.join(map(re.escape, avoid_tokens))
+                mask = filtered_foods['FoodItem'].astype(str).str.contains(pattern, case=False, regex=True, na=False)
+                filtered_foods = filtered_foods[~mask]
 
     meal_target = calorie_target / 3
     min_c, max_c = meal_target*0.75, meal_target*1.25
@@ -373,17 +446,23 @@ if st.session_state['recommendation_clicked']:
         cand = filtered_foods[(filtered_foods['Calories'] >= meal_target*0.6) & (filtered_foods['Calories'] <= meal_target*1.4)]
 
     if not cand.empty:
-        cand['cal_diff'] = (cand['Calories'] - meal_target).abs()
-        prot_max = cand['Protein'].max() if cand['Protein'].max() > 0 else 1.0
-        fibre_max = cand['Fibre'].max() if cand['Fibre'].max() > 0 else 1.0
-        cand['score'] = (-cand['cal_diff']/(cand['cal_diff'].max()+1e-6)) + (cand['Protein']/prot_max)*0.6 + (cand['Fibre']/fibre_max)*0.3
-        cand = cand.sort_values(by='score', ascending=False)
+        # Score on plain arrays; cand itself is never modified
+        cal_diff = np.abs(cand['Calories'].to_numpy(dtype=np.float64) - meal_target)
+        protein = cand['Protein'].to_numpy(dtype=np.float64)
+        fibre = cand['Fibre'].to_numpy(dtype=np.float64)
+        prot_max = protein.max() if protein.max() > 0 else 1.0
+        fibre_max = fibre.max() if fibre.max() > 0 else 1.0
+        scores = (-cal_diff/(cal_diff.max()+1e-6)) + (protein/prot_max)*0.6 + (fibre/fibre_max)*0.3
         
         # --- Start: Added diversity by sampling from top candidates ---
         sample_size = min(10, len(cand))
         # Take the top 5*N candidates and sample 10 from them to add diversity
         top_n = min(len(cand), 50) 
-        diet_top = cand.head(top_n).drop_duplicates().sample(n=sample_size, replace=False, random_state=42)
+        # partial selection of the top_n scores, then only those are sorted (best first)
+        top_idx = np.argpartition(-scores, top_n - 1)[:top_n]
+        top_idx = top_idx[np.argsort(-scores[top_idx], kind='stable')]
+        diet_pool = cand.iloc[top_idx].drop_duplicates()
+        diet_top = diet_pool.iloc[np.random.default_rng(SAMPLE_SEED).choice(len(diet_pool), size=min(sample_size, len(diet_pool)), replace=False)]
         # --- End: Added diversity ---
         
         diet_top = diet_top[['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar']].reset_index(drop=True)
@@ -397,26 +476,18 @@ if st.session_state['recommendation_clicked']:
         st.info("No suitable diet items found for your criteria.")
 
     # Exercise recommendation
-    ex = exercise_df.copy()
-    if 'Activity' not in ex.columns:
-        ex.rename(columns={ex.columns[0]:'Activity'}, inplace=True)
-    if 'Calories_per_kg' not in ex.columns:
-        ex['Calories_per_kg'] = pd.to_numeric(ex['MET'], errors='coerce')*1.05 if 'MET' in ex.columns else 0.0
-    if 'Category' not in ex.columns:
-        ex['Category'] = 'Mixed'
-    ex['Calories_per_kg'] = pd.to_numeric(ex['Calories_per_kg'], errors='coerce').fillna(0)
+    ex, is_cardio, is_strength, demo_links = prepare_exercises(str(EXERCISE_MASTER_FILE), EXERCISE_MASTER_FILE.stat().st_mtime)
     ex['Est_Cals_session'] = ex['Calories_per_kg'] * weight_kg
 
     if goal == "Lose Weight":
         ex_candidates = ex.sort_values(by='Calories_per_kg', ascending=False)
     elif goal == "Gain Weight":
-        ex_candidates = ex[ex['Category'].str.lower().str.contains('strength')]
+        ex_candidates = ex[is_strength]
         if ex_candidates.empty:
             ex_candidates = ex.sort_values(by='Calories_per_kg', ascending=False)
     else:
-        cardio = ex[ex['Category'].str.lower().str.contains('cardio')].head(3)
-        strength = ex[ex['Category'].str.lower().str.contains('strength')].head(2)
-        ex_candidates = pd.concat([cardio, strength])
+        # first 3 cardio + first 2 strength rows, picked by position in one take
+        ex_candidates = ex.iloc[np.concatenate([np.flatnonzero(is_cardio)[:3], np.flatnonzero(is_strength)[:2]])]
     if ex_candidates.empty:
         ex_candidates = ex.sort_values(by='Calories_per_kg', ascending=False).head(5)
 
@@ -426,32 +497,27 @@ if st.session_state['recommendation_clicked']:
     
     # Use top 20 candidates for sampling
     top_n_ex = min(len(ex_candidates_final), 20)
-    ex_top = ex_candidates_final.head(top_n_ex).sample(n=sample_size_ex, replace=False, random_state=42)
+    ex_top = ex_candidates_final.iloc[np.random.default_rng(SAMPLE_SEED).choice(top_n_ex, size=sample_size_ex, replace=False)]
     # --- End: Added exercise diversity ---
 
     ex_top = ex_top.reset_index(drop=True)
-    ex_top['demo_link'] = ex_top['Activity'].apply(lambda x: make_youtube_search_link(x))
+    ex_top['demo_link'] = ex_top['Activity'].map(demo_links)
 
     st.subheader("🏋️ Exercise Recommendations")
     
     # --- Start: Made YouTube links clickable in Streamlit table ---
-    # Create a column with clickable markdown links
     display_ex = ex_top[['Activity','Category','Calories_per_kg','Est_Cals_session','demo_link']].rename(
         columns={'Calories_per_kg':'Cal/kg','Est_Cals_session':'Est_kcal/session','demo_link':'Demo Link'})
-    
-    # Convert 'Demo Link' column to markdown for display in st.dataframe
-    display_ex['Demo Link'] = display_ex.apply(lambda row: f"[Watch]({row['Demo Link']})", axis=1)
-
-    # Use st.markdown and the to_html/css styling for rendering clickable links inside a DataFrame
-    # Note: Streamlit's st.dataframe does not support clickable markdown links directly. 
-    # The following workaround uses st.markdown to render the HTML, making the links clickable.
-    st.markdown(
-        display_ex.to_html(escape=False, index=False),
-        unsafe_allow_html=True
+
+    # 'Demo Link' keeps the raw URLs; LinkColumn renders them as clickable "Watch" links
+    # (Arrow-backed st.dataframe instead of a to_html string pushed through st.markdown)
+    st.dataframe(
+        display_ex,
+        use_container_width=True,
+        hide_index=True,
+        column_config={'Demo Link': st.column_config.LinkColumn('Demo Link', display_text='Watch')},
     )
-    # Fallback to st.dataframe if the above HTML is too complex or fails (removed for clean output):
-    # st.dataframe(display_ex.head(10), use_container_width=True) 
-    
+
     # --- End: Made YouTube links clickable in Streamlit table ---
 
     # Personalized tips
@@ -467,26 +533,43 @@ if st.session_state['recommendation_clicked']:
     if med_condition != "None":
         tips.append(f"Diet filtered for medical condition: {med_condition}. Consult a doctor for specific advice.")
 
+    # Save plan
+    plan_body = {"user": user, "calorie_target": int(calorie_target),
+                 "diet_top": diet_top.to_dict(orient='records'),
+                 "exercise_top": ex_top.to_dict(orient='records'), # Save ex_top with original structure for PDF/JSON
+                 "tips": tips}
+    # Reruns that keep this branch alive with unchanged results reuse the files already written
+    plan_key = hashlib.md5(json.dumps(plan_body, sort_keys=True, default=str).encode()).hexdigest()
+    plan_changed = st.session_state.get('last_plan_key') != plan_key
+    if plan_changed:
+        now_tag = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_out = Path.cwd() / "saved_plans"
+        safe_out.mkdir(exist_ok=True)
+        safe_name = name.strip().replace(" ", "_").replace(".", "")
+        st.session_state['last_plan_paths'] = (safe_out / f"plan_{safe_name}_{now_tag}.json",
+                                               safe_out / f"plan_{safe_name}_{now_tag}.pdf")
+    json_path, pdf_path = st.session_state['last_plan_paths']
+
+    # PDF is built in the background while tips render and the JSON is written
+    if plan_changed:
+        st.session_state['pdf_future'] = get_pdf_pool().submit(create_pdf, user, diet_top, ex_top, tips, pdf_path)
+
     st.subheader("💡 Personalized Tips")
     for t in tips:
         st.write("• " + t)
 
-    # Save plan
-    now_tag = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_out = Path.cwd() / "saved_plans"
-    safe_out.mkdir(exist_ok=True)
-    safe_name = name.strip().replace(" ", "_").replace(".", "")
-    json_path = safe_out / f"plan_{safe_name}_{now_tag}.json"
-    plan = {"meta": {"user": user, "generated_at": str(datetime.datetime.now()), "calorie_target": int(calorie_target)}, 
-            "diet_top": diet_top.to_dict(orient='records'), 
-            "exercise_top": ex_top.to_dict(orient='records'), # Save ex_top with original structure for PDF/JSON
-            "tips": tips}
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(plan, f, indent=2)
+    if plan_changed:
+        plan = {"meta": {"user": user, "generated_at": str(datetime.datetime.now()), "calorie_target": plan_body["calorie_target"]},
+                "diet_top": plan_body["diet_top"],
+                "exercise_top": plan_body["exercise_top"],
+                "tips": tips}
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=2)
+        st.session_state['last_plan_key'] = plan_key
     st.success(f"✅ Plan saved successfully!")
 
-    pdf_path = safe_out / f"plan_{safe_name}_{now_tag}.pdf"
-    create_pdf(user, diet_top, ex_top, tips, pdf_path)
+    # Download button appears once the PDF is ready (result() re-raises any PDF error)
+    st.session_state['pdf_future'].result()
     with open(pdf_path, "rb") as f:
         st.download_button("📄 Download My Plan (PDF)", data=f, file_name=pdf_path.name, type="primary")
 
@@ -494,198 +577,418 @@ if st.session_state['recommendation_clicked']:
 # Custom Chatbot (Project-specific, no OpenAI)
 # ---------------------------
 
-if 'chat_history' not in st.session_state:
-    st.session_state['chat_history'] = []
+# Chat turns are written to SQLite under a per-session id; session_state holds the id and a
+# fixed-size ring of the most recent turns (all that is ever displayed or sent to the API).
+# The id exists only in this server-side session, never in the URL, so a link can't be used to
+# read a chat back; a browser refresh starts a new session with an empty chat.
+CHAT_HISTORY_MAXLEN = 64
+# The log lives in chat_history.db in the working directory (next to saved_plans/); turns older
+# than this are deleted whenever a new browser session starts
+CHAT_DB_PATH = Path.cwd() / "chat_history.db"
+CHAT_RETENTION_DAYS = 7
+
+@st.cache_resource
+def get_chat_db():
+    # One autocommit connection shared by all sessions (sqlite3 is built serialized);
+    # WAL keeps the inserts from different sessions from blocking readers of the file
+    con = sqlite3.connect(CHAT_DB_PATH, check_same_thread=False, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("CREATE TABLE IF NOT EXISTS msgs(id INTEGER PRIMARY KEY, session TEXT, role TEXT, txt TEXT, ts REAL NOT NULL)")
+    if 'ts' not in {r[1] for r in con.execute("PRAGMA table_info(msgs)")}:
+        # log written before turns were timestamped: its rows fall to the next purge
+        con.execute("ALTER TABLE msgs ADD COLUMN ts REAL NOT NULL DEFAULT 0")
+    # the log is never read back per session, so only the purge needs an index
+    con.execute("DROP INDEX IF EXISTS msgs_session_id")
+    con.execute("CREATE INDEX IF NOT EXISTS msgs_ts ON msgs(ts)")
+    return con
+
+def purge_chat_log():
+    get_chat_db().execute("DELETE FROM msgs WHERE ts < ?", (time.time() - CHAT_RETENTION_DAYS * 86400,))
+
+if 'chat_session' not in st.session_state:
+    st.session_state['chat_session'] = uuid.uuid4().hex
+    st.session_state['chat_history'] = collections.deque(maxlen=CHAT_HISTORY_MAXLEN)
+    purge_chat_log()
+    # links saved while the id was kept in the URL still carry it; drop it
+    if 'chat' in st.query_params:
+        del st.query_params['chat']
 
 st.markdown("---")
 st.subheader("💬 Health Assistant Chatbot")
 st.markdown("*Ask me about TDEE, BMR, protein intake, symptoms, diet tips, or how to use this app!*")
 
-# The custom_chatbot_response function remains the same as provided by the user (no changes here)
-def custom_chatbot_response(query, context):
+# Chatbot intents, checked in priority order (first match wins). Each intent is one
+# compiled pattern: plain substring alternations like the original `in` checks, with
+# lookaheads where several words must all appear. Replies are strings, or callables
+# of the user context when they are personalised. (One search per intent measured faster
+# on chat-length messages than a combined named-group alternation or an Aho-Corasick pass.)
+CHAT_INTENTS = [(intent, re.compile(pattern, re.S)) for intent, pattern in [
+    ('greet', r"hi|hello|hey|hii|hai"),
+    ('farewell', r"bye|goodbye|see you|thanks|thank you"),
+    ('tdee_def', r"^(?=.*what).*tdee"),
+    ('bmr_def', r"^(?=.*what).*bmr"),
+    ('my_tdee', r"my tdee|tdee"),
+    ('protein', r"protein"),
+    ('fever', r"fever|temperature"),
+    ('cough', r"cough"),
+    ('headache', r"headache|head ache"),
+    ('diabetes', r"diabetes"),
+    ('hypertension', r"hypertension|blood pressure|bp"),
+    ('lose_weight', r"lose weight|weight loss"),
+    ('gain_weight', r"gain weight|weight gain"),
+    ('exercise', r"exercise|workout"),
+    ('how_to_use', r"^(?=.*how)(?=.*(?:use|work)).*(?:app|this)"),
+    ('download', r"download|pdf"),
+    ('medical', r"medical condition|health condition"),
+    ('small_talk', r"how are you|how r u|how's it going"),
+]]
+
+def chat_greet(context):
+    name = context.get('name', '')
+    if name:
+        return f"Hello {name}! 👋 How can I assist you today? You can ask me about TDEE, BMR, diet, exercises, symptoms, or medical conditions."
+    return "Hello! 👋 I'm your health assistant. Ask me about TDEE, protein needs, symptoms, or how to use this app!"
+
+def chat_my_tdee(context):
+    tdee = context.get('tdee')
+    if tdee:
+        return f"Your estimated TDEE is approximately **{int(tdee)} kcal/day**. This is based on your age, gender, height, weight, and activity level."
+    return "I don't have your TDEE yet. Please click 'Get Recommendations' button after entering your details to calculate your TDEE."
+
+def chat_protein(context):
+    weight = context.get('weight_kg')
+    if weight:
+        return f"For your weight ({weight} kg), aim for approximately **{context['protein_g']}g of protein per day**. Range: 1.2-2.0 g/kg depending on your activity level and goals."
+    return "Aim for 1.2–2.0 g of protein per kg of body weight daily. For muscle gain, go higher (1.6-2.0 g/kg). Please enter your weight for a personalized recommendation."
+
+def chat_exercise(context):
+    goal = context.get('goal', '')
+    if "lose" in goal.lower():
+        return "For weight loss: Focus on cardio exercises (running, cycling, swimming) 4-5 times/week, combined with strength training 2-3 times/week. Aim for 150-300 minutes of moderate activity per week."
+    elif "gain" in goal.lower():
+        return "For weight gain: Prioritize strength training (weightlifting, resistance exercises) 4-5 times/week. Focus on compound movements like squats, deadlifts, bench press. Limit cardio to 2-3 times/week."
+    return "For maintenance: Combine cardio (3 days/week) and strength training (3 days/week). Aim for at least 150 minutes of moderate exercise weekly."
+
+CHAT_RESPONSES = {
+    'greet': chat_greet,
+    'farewell': "You're welcome! Stay healthy and feel free to ask anytime. Take care! 😊",
+    'tdee_def': "TDEE stands for Total Daily Energy Expenditure. It's the total number of calories you burn in a day, including your BMR (Basal Metabolic Rate) and physical activity. Your TDEE helps determine how many calories you should eat to lose, maintain, or gain weight.",
+    'bmr_def': "BMR (Basal Metabolic Rate) is the number of calories your body needs at rest to maintain basic functions like breathing, circulation, and cell production. TDEE = BMR × Activity Factor.",
+    'my_tdee': chat_my_tdee,
+    'protein': chat_protein,
+    'fever': "For fever: Rest, stay hydrated, and take paracetamol if needed. If fever persists beyond 3 days or exceeds 103°F (39.4°C), consult a doctor immediately.",
+    'cough': "For cough: Stay hydrated, use honey or warm water, avoid cold foods. If cough persists for more than 2 weeks or includes blood, see a healthcare professional.",
+    'headache': "For headache: Rest in a quiet, dark room, stay hydrated, and try a cold/warm compress. Avoid screens. If severe or persistent, consult a doctor.",
+    'diabetes': "For diabetes management: Focus on low-GI foods (whole grains, legumes, vegetables), avoid refined sugars, maintain regular meal times, and monitor blood sugar levels. Exercise regularly and consult your doctor for personalized advice.",
+    'hypertension': "For hypertension: Reduce sodium intake, eat potassium-rich foods (bananas, spinach), limit caffeine and alcohol, exercise regularly, manage stress, and maintain a healthy weight. Regular monitoring is important.",
+    'lose_weight': "For weight loss: Create a calorie deficit (300-500 kcal/day), focus on high-protein and high-fiber foods, do cardio + strength training 4-5 days/week, stay hydrated, and get adequate sleep (7-8 hours).",
+    'gain_weight': "For weight gain: Eat in a calorie surplus (+300-500 kcal/day), increase protein intake, do strength training 4-5 times/week, eat frequent meals, and include healthy fats (nuts, avocado, olive oil).",
+    'exercise': chat_exercise,
+    'how_to_use': "To use this app: 1) Fill in all required fields (name, age, gender, height, weight, goal, diet preference). 2) Click 'Get Recommendations' to see personalized diet and exercise plans. 3) Download your plan as PDF. 4) Ask me any questions here in the chatbot!",
+    'download': "After generating recommendations, scroll down to find the '📄 Download My Plan (PDF)' button. Your personalized plan will be saved with your name and timestamp.",
+    'medical': "You can select a medical condition from the dropdown (optional). The app will filter out foods you should avoid. For serious conditions, always consult a healthcare professional.",
+    'small_talk': "I'm doing great, thank you for asking! 😊 I'm here to help you with diet and exercise recommendations. What would you like to know?",
+}
+
+CHAT_FALLBACK = ("I'm not sure about that. Try asking me: 'What is TDEE?', 'What is BMR?', 'How much protein should I eat?', "
+                 "'What should I do for fever?', 'How to lose weight?', 'How to use this app?', or say 'hi' to chat!")
+
+def chat_intent(query):
+    # name of the first matching intent, None if nothing matches
     q = query.lower().strip()
-    
-    # Greetings
-    if any(w in q for w in ["hi", "hello", "hey", "hii", "hai"]):
-        name = context.get('name', '')
-        if name:
-            return f"Hello {name}! 👋 How can I assist you today? You can ask me about TDEE, BMR, diet, exercises, symptoms, or medical conditions."
-        return "Hello! 👋 I'm your health assistant. Ask me about TDEE, protein needs, symptoms, or how to use this app!"
-    
-    # Farewell
-    if any(w in q for w in ["bye", "goodbye", "see you", "thanks", "thank you"]):
-        return "You're welcome! Stay healthy and feel free to ask anytime. Take care! 😊"
-    
-    # What is TDEE?
-    if "what" in q and "tdee" in q:
-        return "TDEE stands for Total Daily Energy Expenditure. It's the total number of calories you burn in a day, including your BMR (Basal Metabolic Rate) and physical activity. Your TDEE helps determine how many calories you should eat to lose, maintain, or gain weight."
-    
-    # What is BMR?
-    if "what" in q and "bmr" in q:
-        return "BMR (Basal Metabolic Rate) is the number of calories your body needs at rest to maintain basic functions like breathing, circulation, and cell production. TDEE = BMR × Activity Factor."
-    
-    # My TDEE
-    if "my tdee" in q or "tdee" in q:
-        tdee = context.get('tdee')
-        if tdee:
-            return f"Your estimated TDEE is approximately **{int(tdee)} kcal/day**. This is based on your age, gender, height, weight, and activity level."
-        return "I don't have your TDEE yet. Please click 'Get Recommendations' button after entering your details to calculate your TDEE."
-    
-    # Protein intake
-    if "protein" in q:
-        weight = context.get('weight_kg')
-        if weight:
-            return f"For your weight ({weight} kg), aim for approximately **{round(1.6 * weight, 1)}g of protein per day**. Range: 1.2-2.0 g/kg depending on your activity level and goals."
-        return "Aim for 1.2–2.0 g of protein per kg of body weight daily. For muscle gain, go higher (1.6-2.0 g/kg). Please enter your weight for a personalized recommendation."
-    
-    # Symptoms - Fever
-    if "fever" in q or "temperature" in q:
-        return "For fever: Rest, stay hydrated, and take paracetamol if needed. If fever persists beyond 3 days or exceeds 103°F (39.4°C), consult a doctor immediately."
-    
-    # Symptoms - Cough
-    if "cough" in q:
-        return "For cough: Stay hydrated, use honey or warm water, avoid cold foods. If cough persists for more than 2 weeks or includes blood, see a healthcare professional."
-    
-    # Symptoms - Headache
-    if "headache" in q or "head ache" in q:
-        return "For headache: Rest in a quiet, dark room, stay hydrated, and try a cold/warm compress. Avoid screens. If severe or persistent, consult a doctor."
-    
-    # Diabetes
-    if "diabetes" in q:
-        return "For diabetes management: Focus on low-GI foods (whole grains, legumes, vegetables), avoid refined sugars, maintain regular meal times, and monitor blood sugar levels. Exercise regularly and consult your doctor for personalized advice."
-    
-    # Hypertension
-    if "hypertension" in q or "blood pressure" in q or "bp" in q:
-        return "For hypertension: Reduce sodium intake, eat potassium-rich foods (bananas, spinach), limit caffeine and alcohol, exercise regularly, manage stress, and maintain a healthy weight. Regular monitoring is important."
-    
-    # Weight loss
-    if "lose weight" in q or "weight loss" in q:
-        return "For weight loss: Create a calorie deficit (300-500 kcal/day), focus on high-protein and high-fiber foods, do cardio + strength training 4-5 days/week, stay hydrated, and get adequate sleep (7-8 hours)."
-    
-    # Weight gain
-    if "gain weight" in q or "weight gain" in q:
-        return "For weight gain: Eat in a calorie surplus (+300-500 kcal/day), increase protein intake, do strength training 4-5 times/week, eat frequent meals, and include healthy fats (nuts, avocado, olive oil)."
-    
-    # Exercise
-    if "exercise" in q or "workout" in q:
-        goal = context.get('goal', '')
-        if "lose" in goal.lower():
-            return "For weight loss: Focus on cardio exercises (running, cycling, swimming) 4-5 times/week, combined with strength training 2-3 times/week. Aim for 150-300 minutes of moderate activity per week."
-        elif "gain" in goal.lower():
-            return "For weight gain: Prioritize strength training (weightlifting, resistance exercises) 4-5 times/week. Focus on compound movements like squats, deadlifts, bench press. Limit cardio to 2-3 times/week."
-        return "For maintenance: Combine cardio (3 days/week) and strength training (3 days/week). Aim for at least 150 minutes of moderate exercise weekly."
-    
-    # How to use app
-    if "how" in q and ("use" in q or "work" in q) and ("app" in q or "this" in q):
-        return "To use this app: 1) Fill in all required fields (name, age, gender, height, weight, goal, diet preference). 2) Click 'Get Recommendations' to see personalized diet and exercise plans. 3) Download your plan as PDF. 4) Ask me any questions here in the chatbot!"
-    
-    # Download plan
-    if "download" in q or "pdf" in q:
-        return "After generating recommendations, scroll down to find the '📄 Download My Plan (PDF)' button. Your personalized plan will be saved with your name and timestamp."
-    
-    # Medical condition
-    if "medical condition" in q or "health condition" in q:
-        return "You can select a medical condition from the dropdown (optional). The app will filter out foods you should avoid. For serious conditions, always consult a healthcare professional."
-    
-    # Small talk
-    if any(w in q for w in ["how are you", "how r u", "how's it going"]):
-        return "I'm doing great, thank you for asking! 😊 I'm here to help you with diet and exercise recommendations. What would you like to know?"
-    
-    # Default fallback
-    return ("I'm not sure about that. Try asking me: 'What is TDEE?', 'What is BMR?', 'How much protein should I eat?', "
-            "'What should I do for fever?', 'How to lose weight?', 'How to use this app?', or say 'hi' to chat!")
+    for intent, pattern in CHAT_INTENTS:
+        if pattern.search(q):
+            return intent
+    return None
 
-# ----- Chat UI integration -----
+def custom_chatbot_response(query, context):
+    intent = chat_intent(query)
+    if intent:
+        reply = CHAT_RESPONSES[intent]
+        return reply(context) if callable(reply) else reply
+    # Default fallback
+    return CHAT_FALLBACK
 
-# Build context from available user inputs (these variables should exist in your app)
-user_context = {
-    'name': globals().get('name', '') or '',
-    'weight_kg': globals().get('weight_kg', None),
-    'goal': globals().get('goal', '') or '',
-    'tdee': None
-}
-# Try to compute TDEE if inputs exist (safe)
-try:
-    _age = int(globals().get('age')) if globals().get('age') is not None and globals().get('age') != '' else None
-    _height = float(globals().get('height_cm')) if globals().get('height_cm') is not None and globals().get('height_cm') != '' else None
-    _weight = float(globals().get('weight_kg')) if globals().get('weight_kg') is not None and globals().get('weight_kg') != '' else None
-    _gender = globals().get('gender') if globals().get('gender') is not None else ''
-    _freq = int(globals().get('workout_freq')) if globals().get('workout_freq') is not None else 0
-    if _age and _height and _weight and _gender != 'Select Gender':
-        try:
-            user_context['tdee'] = int(tdee_bmr(_age, _gender, _height, _weight, _freq))
-        except Exception:
-            user_context['tdee'] = None
-    else:
-        user_context['tdee'] = None
-except Exception:
-    user_context['tdee'] = None
+# Rule-based replies depend only on the normalized message and the context values, so repeats
+# ("hi", "download plan", ...) are answered from an LRU (lives until the next full script rerun;
+# chat turns only rerun the chat fragment)
+@functools.lru_cache(maxsize=512)
+def cached_chatbot_reply(q, context_items):
+    return custom_chatbot_response(q, dict(context_items))
 
+def local_chat_reply(user_msg, context):
+    return cached_chatbot_reply(user_msg.lower().strip(), tuple(sorted(context.items())))
 
-# --- Start: Chat input & send button (Modified for Enter key submission) ---
-col_left, col_right = st.columns([4,1])
-with col_left:
-    # Use a form to capture the enter key press
-    with st.form(key='chat_form', clear_on_submit=True):
-        chat_input = st.text_input("Type your message here...", key="chat_input_box_v2", label_visibility="collapsed")
-        send_click = st.form_submit_button("Send", key="chat_send_btn_v2") # This button is submitted on enter key press
-# --- End: Chat input & send button ---
+# ----- Chat UI integration -----
 
+def append_chat_msg(who, text):
+    get_chat_db().execute("INSERT INTO msgs(session, role, txt, ts) VALUES (?, ?, ?, ?)",
+                          (st.session_state['chat_session'], who, text, time.time()))
+    st.session_state['chat_history'].append((who, text))  # oldest turn drops off when full
 
 def append_user_msg(text):
-    st.session_state['chat_history'].append(("You", text))
+    append_chat_msg("You", text)
 
 def append_bot_msg(text):
-    st.session_state['chat_history'].append(("Bot", text))
-
-# If OpenAI key exists and you want to use it, keep that logic; otherwise fallback to local function
-use_openai = False
-try:
-    if openai_key and HAS_OPENAI: # Check the new openai_key variable
-        use_openai = True
-        import openai
-        openai.api_key = openai_key
-except Exception:
-    use_openai = False
-
-if send_click and chat_input and chat_input.strip():
-    user_msg = chat_input.strip()
-    append_user_msg(user_msg)
-
-    bot_reply = None
-
-    # Try OpenAI if user provided key and library present
-    if use_openai:
-        try:
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a concise, friendly health assistant. Keep answers non-medical and suggest seeing a clinician for serious issues."},
-                    {"role": "user", "content": user_msg}
-                ],
-                max_tokens=250,
-                temperature=0.2
-            )
-            bot_reply = resp.choices[0].message.content.strip()
-        except Exception as e:
-            # fallback to local function on any error
-            bot_reply = custom_chatbot_response(user_msg, user_context)
-    else:
-        # Local rule-based reply using the function the user provided
-        bot_reply = custom_chatbot_response(user_msg, user_context)
-
-    append_bot_msg(bot_reply)
-
-# Display chat history (most recent last)
-if st.session_state['chat_history']:
-    st.markdown("**Conversation**")
-    # Display the last 10 messages
-    for who, txt in st.session_state['chat_history'][-10:]:
-        if who == "You":
-            st.markdown(f"**You:** {txt}")
+    append_chat_msg("Bot", text)
+
+def chat_tail(n):
+    # last n (who, text) pairs of this session, oldest first, from the in-memory ring
+    history = st.session_state['chat_history']
+    return list(itertools.islice(history, max(len(history) - n, 0), None))
+
+# Upper bound on how long one chat turn may wait on the API before the local reply is used
+# (the client default is 10 minutes, during which the whole script run is blocked)
+OPENAI_TIMEOUT_S = 20.0
+# Transient failures (429, 5xx, connection errors, timeouts) are retried by the client itself with
+# exponential backoff (honouring Retry-After); the local reply is used only once these run out
+OPENAI_MAX_RETRIES = 3
+# Requests in flight at once across all sessions (prefetches and streamed replies)
+OPENAI_MAX_IN_FLIGHT = 10
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key: str):
+    # One client per key, so its HTTP connection pool is reused across chat turns and reruns;
+    # HTTP/2 (when the optional h2 package is present) multiplexes the concurrent prefetches
+    # and the streamed reply over one TLS connection
+    import httpx  # installed with openai
+    from openai import OpenAI
+    http_client = httpx.Client(
+        http2=importlib.util.find_spec('h2') is not None,
+        timeout=OPENAI_TIMEOUT_S,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    )
+    return OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT_S, max_retries=OPENAI_MAX_RETRIES, http_client=http_client)
+
+@st.cache_resource
+def get_openai_slots():
+    return threading.BoundedSemaphore(OPENAI_MAX_IN_FLIGHT)
+
+OPENAI_CHAT_PARAMS = dict(model="gpt-4o-mini", temperature=0.2)
+
+# Generation budget by intent: short messages that are greetings or app questions get a short
+# max_tokens (fewer decode steps before the reply finishes); everything else gets the default.
+# Longer messages always get the default, since the substring intents are loose ("hi" in "this")
+CHAT_MAX_TOKENS = {'greet': 30, 'farewell': 30, 'small_talk': 30, 'download': 80, 'how_to_use': 80}
+CHAT_MAX_TOKENS_DEFAULT = 200
+CHAT_SHORT_MSG_WORDS = 5
+
+def chat_max_tokens(user_msg):
+    if len(user_msg.split()) > CHAT_SHORT_MSG_WORDS:
+        return CHAT_MAX_TOKENS_DEFAULT
+    return CHAT_MAX_TOKENS.get(chat_intent(user_msg), CHAT_MAX_TOKENS_DEFAULT)
+
+# Fixed system prompt and a stable (sorted-key) profile message lead every request, so the
+# prefix is byte-identical across turns and eligible for OpenAI's automatic prompt caching;
+# then a fixed-size window of recent turns, then the new user message
+OPENAI_SYSTEM_PROMPT = "You are a concise, friendly health assistant. Keep answers non-medical and suggest seeing a clinician for serious issues."
+CHAT_WINDOW_MSGS = 6  # earlier turns are not sent, so prompt size stays bounded
+
+def build_chat_messages(context, history, user_msg):
+    # history: prior (who, text) pairs, not including user_msg
+    recent = [{"role": "user" if who == "You" else "assistant", "content": txt}
+              for who, txt in history[-CHAT_WINDOW_MSGS:]]
+    return [
+        {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+        {"role": "system", "content": "User profile: " + json.dumps(context, sort_keys=True, default=str)},
+        *recent,
+        {"role": "user", "content": user_msg},
+    ]
+
+# Prompts are token-counted locally before the request: history is dropped oldest-first to fit
+# the budget, and a prompt that still doesn't fit gets the local reply instead of a server 400
+CHAT_PROMPT_TOKEN_BUDGET = 6000
+
+@st.cache_resource(show_spinner=False)
+def get_token_encoder():
+    # None when tiktoken is missing or its encoding can't be loaded (it is downloaded on first use)
+    if not HAS_TIKTOKEN:
+        return None
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(OPENAI_CHAT_PARAMS["model"])
+    except Exception:
+        return None
+
+@functools.lru_cache(maxsize=1024)
+def count_tokens(text):
+    # history messages repeat across turns, so each text is encoded once
+    return len(get_token_encoder().encode(text))
+
+def fit_chat_messages(messages):
+    # messages as built by build_chat_messages: two system messages, history, then the user message
+    if get_token_encoder() is None:
+        return messages
+    head, history, user = messages[:2], messages[2:-1], messages[-1]
+    fixed = sum(count_tokens(m["content"]) for m in head) + count_tokens(user["content"])
+    sizes = [count_tokens(m["content"]) for m in history]
+    while history and fixed + sum(sizes) > CHAT_PROMPT_TOKEN_BUDGET:
+        history, sizes = history[1:], sizes[1:]
+    if fixed + sum(sizes) > CHAT_PROMPT_TOKEN_BUDGET:
+        return None
+    return [*head, *history, user]
+
+CHAT_REPLY_CACHE_SIZE = 200  # OpenAI replies kept per session
+
+def remember_chat_reply(reply_cache, key, reply):
+    reply_cache[key] = reply
+    if len(reply_cache) > CHAT_REPLY_CACHE_SIZE:
+        reply_cache.pop(next(iter(reply_cache)))  # drop the oldest entry
+
+def normalize_chat_msg(text):
+    # "What's my TDEE?" / "whats my tdee" -> "whats my tdee"
+    return " ".join(re.sub(r"[^\w\s]", "", text.lower()).split())
+
+# The "Try asking" prompts; with an API key they are requested together in the background
+# once per session, so sending one of them is answered without waiting on the API
+CHAT_SUGGESTIONS = ["Hi", "What is my TDEE?", "Protein for 70kg?", "Download plan"]
+
+@st.cache_resource
+def get_chat_pool():
+    return ThreadPoolExecutor(max_workers=len(CHAT_SUGGESTIONS))
+
+# Streamed deltas are pushed to the page in batches instead of one re-render per token
+STREAM_FLUSH_S = 0.05
+STREAM_FLUSH_CHARS = 8
+
+def batch_deltas(deltas):
+    buf, buf_len, last_flush = [], 0, time.monotonic()
+    for d in deltas:
+        buf.append(d)
+        buf_len += len(d)
+        if buf_len > STREAM_FLUSH_CHARS or time.monotonic() - last_flush > STREAM_FLUSH_S:
+            yield "".join(buf)
+            buf, buf_len, last_flush = [], 0, time.monotonic()
+    if buf:
+        yield "".join(buf)  # whatever is left when the stream ends
+
+def fetch_openai_reply(client, slots, messages, max_tokens):
+    # runs on a pool thread: plain (non-streamed) completion, no Streamlit calls
+    with slots:
+        resp = client.chat.completions.create(messages=messages, max_tokens=max_tokens, **OPENAI_CHAT_PARAMS)
+    return resp.choices[0].message.content.strip()
+
+# The transcript is one markdown string per distinct tail of messages, so an unchanged
+# conversation is a cache hit and one page element instead of one per message
+@functools.lru_cache(maxsize=32)
+def format_chat_transcript(rows):
+    return "\n\n".join(f"**{who}:** {txt}" for who, txt in rows)
+
+# The chat context with its derived numbers, computed once per distinct profile and shared by the
+# rule-based replies and the OpenAI profile message
+@st.cache_data(show_spinner=False, max_entries=256)
+def chat_profile(name, weight_kg, goal, tdee):
+    return {
+        'name': name,
+        'weight_kg': weight_kg,
+        'goal': goal,
+        'tdee': tdee,
+        'protein_g': round(1.6 * weight_kg, 1) if weight_kg else None,  # 1.6 g/kg daily target
+    }
+
+@st.fragment
+def chat_panel():
+    # Sending a message reruns only this panel, not the recommendation section above
+
+    # Build context from available user inputs (these variables should exist in your app);
+    # TDEE is the one the recommendation branch stored this session, else computed from the inputs if all are set
+    user_tdee = st.session_state.get('user_tdee')
+    if user_tdee is None:
+        _age, _height, _weight, _gender = (globals().get(k) for k in ('age', 'height_cm', 'weight_kg', 'gender'))
+        if _age and _height and _weight and _gender and _gender != 'Select Gender':
+            user_tdee = tdee_bmr(_age, _gender, _height, _weight, globals().get('workout_freq') or 0)
+    user_context = chat_profile(globals().get('name', '') or '', globals().get('weight_kg', None),
+                                globals().get('goal', '') or '', user_tdee)
+
+    # --- Start: Chat input & send button (Modified for Enter key submission) ---
+    col_left, col_right = st.columns([4,1])
+    with col_left:
+        # Use a form to capture the enter key press
+        with st.form(key='chat_form', clear_on_submit=True):
+            chat_input = st.text_input("Type your message here...", key="chat_input_box_v2", label_visibility="collapsed")
+            send_click = st.form_submit_button("Send", key="chat_send_btn_v2") # This button is submitted on enter key press
+    # --- End: Chat input & send button ---
+
+    # If OpenAI key exists and you want to use it, keep that logic; otherwise fallback to local function
+    use_openai = bool(openai_key and HAS_OPENAI) # Check the new openai_key variable
+
+    # Suggested questions are prefetched only once recommendations have set a profile, and again
+    # whenever that profile changes (replies are keyed on it); stale requests not yet started are dropped
+    ctx_json = json.dumps(user_context, sort_keys=True, default=str)
+    prefetch = st.session_state.get('chat_prefetch')
+    if use_openai and st.session_state.get('user_tdee') is not None and (prefetch is None or prefetch['ctx'] != ctx_json):
+        if prefetch is not None:
+            for fut in prefetch['futures'].values():
+                fut.cancel()
+        client = get_openai_client(openai_key)
+        st.session_state['chat_prefetch'] = {'ctx': ctx_json, 'futures': {
+            (normalize_chat_msg(p), ctx_json): get_chat_pool().submit(fetch_openai_reply, client, get_openai_slots(), build_chat_messages(user_context, [], p), chat_max_tokens(p))
+            for p in CHAT_SUGGESTIONS
+        }}
+
+    if send_click and chat_input and chat_input.strip():
+        user_msg = chat_input.strip()
+        append_user_msg(user_msg)
+
+        bot_reply = None
+
+        # Try OpenAI if user provided key and library present
+        if use_openai:
+            # A repeat of an earlier question (same normalized text, same profile) reuses its reply
+            reply_cache = st.session_state.setdefault('openai_reply_cache', {})
+            cache_key = (normalize_chat_msg(user_msg), ctx_json)
+            bot_reply = reply_cache.get(cache_key)
+            prefetched = st.session_state.get('chat_prefetch', {}).get('futures', {}).get(cache_key)
+            if bot_reply is None and prefetched is not None:
+                try:
+                    bot_reply = prefetched.result()
+                    remember_chat_reply(reply_cache, cache_key, bot_reply)
+                except Exception:
+                    pass  # request it normally below
+            if bot_reply is None:
+                messages = fit_chat_messages(build_chat_messages(user_context, chat_tail(CHAT_WINDOW_MSGS + 1)[:-1], user_msg))
+                if messages is None:
+                    # over the token budget even without history
+                    bot_reply = local_chat_reply(user_msg, user_context)
+            if bot_reply is None:
+                # Tokens are shown as they arrive, as plain text so partial replies aren't re-parsed
+                # as markdown on every update; the placeholder is cleared once the finished reply
+                # is stored (and rendered as markdown, once, in the conversation below)
+                reply_box = st.empty()
+                try:
+                    # the slot is held until the stream is fully read
+                    with get_openai_slots():
+                        stream = get_openai_client(openai_key).chat.completions.create(
+                            messages=messages,
+                            stream=True,
+                            max_tokens=chat_max_tokens(user_msg),
+                            **OPENAI_CHAT_PARAMS
+                        )
+                        deltas = (chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+                        parts = []
+                        for part in batch_deltas(deltas):
+                            parts.append(part)
+                            reply_box.text("".join(parts))
+                        bot_reply = "".join(parts).strip()
+                    remember_chat_reply(reply_cache, cache_key, bot_reply)
+                except Exception as e:
+                    # fallback to local function on any error the client didn't retry away (including mid-stream)
+                    bot_reply = local_chat_reply(user_msg, user_context)
+                reply_box.empty()
         else:
-            # bot replies may contain markdown (like **bold**) — render as-is
-            st.markdown(f"**Bot:** {txt}")
+            # Local rule-based reply using the function the user provided
+            bot_reply = local_chat_reply(user_msg, user_context)
+
+        append_bot_msg(bot_reply)
+
+    # Display chat history (most recent last)
+    recent = chat_tail(10)
+    if recent:
+        st.markdown("**Conversation**")
+        # Display the last 10 messages as one markdown element; bot replies may contain markdown (like **bold**) — render as-is
+        st.markdown(format_chat_transcript(tuple(recent)))
+
+chat_panel()
 
 # Small quick prompts to help user interact
 st.markdown(
@@ -7,15 +7,23 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json, datetime, urllib.parse, re, os, math
-from fpdf import FPDF
 import joblib
 import warnings
 warnings.filterwarnings("ignore")
 
-# ML imports
-from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, accuracy_score
+# Optional: pyahocorasick for long rule token lists (escaped regex alternation otherwise)
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except Exception:
+    HAS_AHOCORASICK = False
+
+# Optional: orjson for writing saved plans (stdlib json otherwise)
+try:
+    import orjson
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
 
 # ---------------------------
 # CONFIG / PATHS
@@ -64,27 +72,87 @@ add_bg_and_style()
 # ---------------------------
 # Helper IO
 # ---------------------------
+# Parsed once per file version: the mtime in the key invalidates the cache when a CSV changes
+@st.cache_data(show_spinner=False, persist="disk")
+def load_csv(p_str: str, mtime: float):
+    try:
+        try:
+            return pd.read_csv(p_str, on_bad_lines='skip')
+        except pd.errors.ParserError:
+            # the C parser gave up on the file; the python engine is more forgiving
+            return pd.read_csv(p_str, on_bad_lines='skip', engine='python')
+    except Exception:
+        # try with latin1
+        try:
+            return pd.read_csv(p_str, encoding='latin-1', on_bad_lines='skip', engine='python')
+        except Exception:
+            return pd.DataFrame()
+
 def safe_read_csv(p: Path):
     """Robust CSV reader returning DataFrame or empty DataFrame."""
     if p.exists():
-        try:
-            return pd.read_csv(p, on_bad_lines='skip', engine='python')
-        except Exception:
-            # try with latin1
-            try:
-                return pd.read_csv(p, encoding='latin-1', on_bad_lines='skip', engine='python')
-            except Exception:
-                return pd.DataFrame()
+        return load_csv(str(p), p.stat().st_mtime)
     return pd.DataFrame()
 
+def file_mtime(p: Path):
+    return p.stat().st_mtime if p.exists() else None
+
+# ---------------------------
+# Rule token matching
+# ---------------------------
+TOKEN_SPLIT_RE = re.compile(r'[|,;]')
+
+AHOCORASICK_MIN_TOKENS = 20
+
+@st.cache_resource(show_spinner=False)
+def rule_pattern(text):
+    """Lowercase tokens of a '|', ',' or ';' separated rule cell as one compiled alternation, or an Aho-Corasick
+    automaton for long lists (None if there are none). Cached as a resource: the script re-executes on every
+    rerun, so a module-level cache would be rebuilt each time."""
+    tokens = sorted({t.strip().lower() for t in TOKEN_SPLIT_RE.split(text) if t.strip()})
+    if not tokens:
+        return None
+    if HAS_AHOCORASICK and len(tokens) >= AHOCORASICK_MIN_TOKENS:
+        automaton = ahocorasick.Automaton()
+        for t in tokens:
+            automaton.add_word(t, t)
+        automaton.make_automaton()
+        return automaton
+    return re.compile('|'.join(map(re.escape, tokens)))
+
+def token_mask(text: pd.Series, pattern):
+    """True where the (already lowercased) text contains any of the pattern's tokens."""
+    if isinstance(pattern, re.Pattern):
+        return text.str.contains(pattern)
+    # automaton: each text is scanned once, whatever the token count
+    return pd.Series([next(pattern.iter(s), None) is not None for s in text.tolist()], index=text.index, dtype=bool)
+
 # ---------------------------
 # Load Safety Engine / rule CSVs
 # ---------------------------
+# lowercased key (condition, gender) -> its (first) rule row as a dict, with the avoid/limit/recommend
+# matchers compiled in as '_avoid_re' etc.; built once per version of the rules CSV and read-only,
+# so shared as a resource rather than copied on every rerun
+@st.cache_resource(show_spinner=False)
+def rules_by_key(p_str: str, mtime, key_col: str):
+    df = safe_read_csv(Path(p_str))
+    index = {}
+    if key_col in df.columns:
+        for key, row in zip(df[key_col].tolist(), df.to_dict('records')):
+            if isinstance(key, str) and key.lower() not in index:
+                for col in ('avoid', 'limit', 'recommend'):
+                    row[f'_{col}_re'] = rule_pattern(str(row.get(col, "") or ""))
+                index[key.lower()] = row
+    return index
+
 def load_safety_rules():
     rules = {}
     rules['medical_food'] = safe_read_csv(MEDICAL_FOOD_CSV)
     rules['medical_exercise'] = safe_read_csv(MEDICAL_EXERCISE_CSV)
+    rules['medical_food_by_cond'] = rules_by_key(str(MEDICAL_FOOD_CSV), file_mtime(MEDICAL_FOOD_CSV), 'condition')
+    rules['medical_exercise_by_cond'] = rules_by_key(str(MEDICAL_EXERCISE_CSV), file_mtime(MEDICAL_EXERCISE_CSV), 'condition')
     rules['gender_adjust'] = safe_read_csv(GENDER_ADJUST_CSV)
+    rules['gender_adjust_by_gender'] = rules_by_key(str(GENDER_ADJUST_CSV), file_mtime(GENDER_ADJUST_CSV), 'gender')
     rules['frequency'] = safe_read_csv(FREQUENCY_RULES_CSV)
     return rules
 
@@ -96,7 +164,6 @@ safety_rules = load_safety_rules()
 food_df = safe_read_csv(FOOD_MASTER_FILE)
 exercise_df = safe_read_csv(EXERCISE_MASTER_FILE)
 medical_df = safe_read_csv(MEDICAL_FILE)
-rda_df = safe_read_csv(RDA_CLEANED_FILE) if RDA_CLEANED_FILE.exists() else pd.DataFrame()
 videos_df = safe_read_csv(EXERCISE_VIDEOS_FILE)
 
 # ---------------------------
@@ -105,19 +172,103 @@ videos_df = safe_read_csv(EXERCISE_VIDEOS_FILE)
 NONVEG_TOKENS = {"chicken", "mutton", "lamb", "beef", "pork", "fish", "egg", "eggs", "prawn", "shrimp", "crab", "bacon", "sausage", "tuna", "salmon", "anchovy", "squid", "octopus", "seafood"}
 VEG_HINTS = {"paneer","tofu","dal","lentil","vegetable","veg","vegetarian","sambar","idli","dosa","roti","salad","sprouts","cheese","curry"}
 
-def infer_veg_flag(food_name: str, tags: str = ""):
-    if not isinstance(food_name, str): return None
-    s = (food_name + " " + (tags or "")).lower()
-    for t in NONVEG_TOKENS:
-        if t in s: return 1
-    for v in VEG_HINTS:
-        if v in s: return 0
-    return None
+# Each token set as one compiled alternation (plain substring match, like the original `in` checks)
+NONVEG_RE = re.compile('|'.join(map(re.escape, sorted(NONVEG_TOKENS))))
+VEG_RE = re.compile('|'.join(map(re.escape, sorted(VEG_HINTS))))
+
+def infer_veg_flags(text: pd.Series):
+    """1 for non-veg, 0 for veg, NaN when unknown; text is name + tags per row."""
+    s = text.str.lower()
+    return pd.Series(np.where(s.str.contains(NONVEG_RE), 1.0, np.where(s.str.contains(VEG_RE), 0.0, np.nan)), index=text.index)
+
+# ---------------------------
+# Diet scoring: min-max normalized calorie closeness, protein and fibre, weighted by goal
+# ---------------------------
+def score_candidates(calories, protein, fibre, meal_target, w_cal, w_prot, w_fib):
+    def norm(s):
+        rng = s.max() - s.min()
+        return s*0 if rng == 0 else (s - s.min()) / rng
+    n_cal = 1 - norm(np.abs(calories - meal_target))
+    return n_cal*w_cal + norm(protein)*w_prot + norm(fibre)*w_fib
+
+def column_map(df):
+    """Lowercased column name -> the first column with that name, built once per table."""
+    lc_map = {}
+    for c in df.columns:
+        lc_map.setdefault(c.lower(), c)
+    return lc_map
+
+def get_col(lc_map, keys):
+    return next((lc_map[k] for k in keys if k in lc_map), None)
+
+FOOD_NUMERIC_KEYS = [('Calories', ['calories','energy','kcal']), ('Protein', ['protein']),
+                     ('Carbs', ['carb','carbs','carbohydrate']), ('Fat', ['fat']),
+                     ('Fibre', ['fibre','fiber']), ('Sugar', ['sugar'])]
+
+# exercise categories that count as strength work when the model predicts the strength workout type
+STRENGTH_CATEGORY_RE = re.compile('strength|resistance|weight|power|body')
+
+SAFETY_FLAGS = ['avoid', 'limited', 'ok']
+SAFETY_FLAG_LABELS = {'avoid': 'AVOID', 'limited': 'LIMITED', 'ok': 'OK'}
+
+# The food table with everything that doesn't depend on the user (column mapping, numeric coercion,
+# RDA veg flag join, veg inference, lowercased names), built once per version of the two CSVs
+@st.cache_data(show_spinner=False)
+def build_food_index(food_p: str, food_mtime, rda_p: str, rda_mtime):
+    food_df = load_csv(food_p, food_mtime)
+    rda_df = load_csv(rda_p, rda_mtime) if rda_mtime is not None else pd.DataFrame()
+    food_cols = column_map(food_df)
+    name_col = get_col(food_cols, ['fooditem','dish','description','name','food'])
+
+    foods = food_df
+    foods['FoodItem'] = foods[name_col] if name_col else foods.iloc[:,0].astype(str)
+    for cname, keys in FOOD_NUMERIC_KEYS:
+        src = get_col(food_cols, keys)
+        foods[cname] = pd.to_numeric(foods[src], errors='coerce').fillna(0) if src else 0.0
+
+    # strict veg/nonveg flag using rda or inference
+    if not rda_df.empty and 'FoodItem' in rda_df.columns:
+        if 'VegNonVeg' in rda_df.columns:
+            try: rda_df['VegNonVeg'] = pd.to_numeric(rda_df['VegNonVeg'], errors='coerce')
+            except: pass
+        merged = pd.merge(foods, rda_df[['FoodItem','VegNonVeg']].drop_duplicates(), on='FoodItem', how='left')
+    else:
+        merged = foods.copy()
+        merged['VegNonVeg'] = np.nan
+    veg_text = merged['FoodItem'].map(str) + " " + (merged[name_col].map(str) if name_col else "")
+    merged['InferredVegFlag'] = infer_veg_flags(veg_text)
+    # the dataset's flag (truncated to int) wins where present
+    veg_nonveg = pd.to_numeric(merged['VegNonVeg'], errors='coerce')
+    merged['FinalVegFlag'] = np.trunc(veg_nonveg).fillna(merged['InferredVegFlag'])
+    merged['LowerName'] = merged['FoodItem'].map(str).str.lower()
+    # 0/1/NaN flag, only used for filtering, so it is held as float32; the nutrient columns
+    # stay float64 since they are shown and saved as-is (float32 would print 16.14 as 16.139999)
+    merged['FinalVegFlag'] = merged['FinalVegFlag'].astype(np.float32)
+    return merged[['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar','FinalVegFlag','LowerName']]
 
 # ---------------------------
 # PDF creation with clickable links
 # ---------------------------
-def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
+PDF_EX_HEADERS = ['Activity','Category','Cal/kg','Est_kcal/session','Demo Link']
+
+def pdf_diet_rows(diet_table):
+    # header labels plus every cell string, built in one pass over row tuples
+    headers = list(diet_table.columns[:6])
+    rows = diet_table.head(40)[headers].itertuples(index=False, name=None)
+    return [str(h) for h in headers], [[str(v)[:30] for v in r] for r in rows]
+
+def pdf_exercise_rows(exercise_table):
+    # (activity, category, cal/kg, kcal/session, link url) strings per row; both calorie columns are
+    # numeric and NaN-free here, so they are formatted column-wise with no per-row try/except
+    ex15 = exercise_table.head(15)
+    cal_kg = [f"{v:.2f}" for v in ex15['Calories_per_kg'].tolist()]
+    est_cals = ex15['Est_Cals_session'].astype(np.int64).map(str).tolist()  # truncates, like int()
+    cols = zip(ex15['Activity'].tolist(), ex15['Category'].tolist(), cal_kg, est_cals, ex15['demo_link'].tolist())
+    return [(str(a)[:30], str(c)[:15], ckg, est, str(url)) for a, c, ckg, est, url in cols]
+
+def create_pdf(user_info, diet_table, exercise_table, tips, out_path=None):
+    """Build the plan PDF and return its bytes; also written to out_path when one is given."""
+    from fpdf import FPDF # imported on first PDF, not on every rerun
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=12)
     pdf.add_page()
@@ -133,14 +284,11 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     pdf.set_font("Arial","B",12); pdf.cell(0,6,"Diet Recommendations (per meal approx.)", ln=True)
     pdf.set_font("Arial",size=9)
     if diet_table is not None and not diet_table.empty:
-        headers = list(diet_table.columns[:6])
+        headers, rows = pdf_diet_rows(diet_table)
         colw = [60,22,22,22,22,22]
-        for i,h in enumerate(headers):
-            pdf.cell(colw[i],6,str(h),border=1)
-        pdf.ln()
-        for _, r in diet_table.head(40).iterrows():
-            for i,h in enumerate(headers):
-                pdf.cell(colw[i],6,str(r.get(h,""))[:30],border=1)
+        for vals in [headers] + rows:
+            for w, v in zip(colw, vals):
+                pdf.cell(w,6,v,border=1)
             pdf.ln()
     else:
         pdf.cell(0,6,"No diet recommendations found.", ln=True)
@@ -151,21 +299,14 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     pdf.set_font("Arial", size=9)
     if exercise_table is not None and not exercise_table.empty:
         colw_ex = [40,35,30,30,55]
-        for h in ['Activity','Category','Cal/kg','Est_kcal/session','Demo Link']:
-            pdf.cell(colw_ex[['Activity','Category','Cal/kg','Est_kcal/session','Demo Link'].index(h)],6,str(h),border=1)
+        for w, h in zip(colw_ex, PDF_EX_HEADERS):
+            pdf.cell(w,6,h,border=1)
         pdf.ln()
-        for _, r in exercise_table.head(15).iterrows():
-            pdf.cell(colw_ex[0],6,str(r.get('Activity',''))[:30],border=1)
-            pdf.cell(colw_ex[1],6,str(r.get('Category',''))[:15],border=1)
-            try:
-                pdf.cell(colw_ex[2],6,f"{float(r.get('Calories_per_kg',0)):.2f}",border=1)
-            except:
-                pdf.cell(colw_ex[2],6,str(r.get('Calories_per_kg','')),border=1)
-            try:
-                pdf.cell(colw_ex[3],6,str(int(float(r.get('Est_Cals_session',0)))),border=1)
-            except:
-                pdf.cell(colw_ex[3],6,str(r.get('Est_Cals_session','')),border=1)
-            link_url = str(r.get('demo_link','')) or ""
+        for activity, category, cal_kg, est_cals, link_url in pdf_exercise_rows(exercise_table):
+            pdf.cell(colw_ex[0],6,activity,border=1)
+            pdf.cell(colw_ex[1],6,category,border=1)
+            pdf.cell(colw_ex[2],6,cal_kg,border=1)
+            pdf.cell(colw_ex[3],6,est_cals,border=1)
             if link_url and not link_url.lower().startswith("http"):
                 link_url = "https://" + link_url
             pdf.set_text_color(0,0,255); pdf.set_font("Arial","U",9)
@@ -188,8 +329,12 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
 
     pdf.set_font("Arial", size=7)
     pdf.multi_cell(0,5, "Disclaimer: AI suggestions are for educational purposes. Consult a medical professional for specific medical conditions.")
-    pdf.output(str(out_path))
-    return out_path
+    out = pdf.output(dest='S')
+    # classic fpdf returns the document as a latin-1 str, fpdf2 as a bytearray
+    pdf_bytes = out.encode('latin-1') if isinstance(out, str) else bytes(out)
+    if out_path is not None:
+        Path(out_path).write_bytes(pdf_bytes)
+    return pdf_bytes
 
 # ---------------------------
 # Model training/loading (silent)
@@ -199,34 +344,39 @@ WORKOUT_MODEL_PATH = MODEL_DIR / "workout_classifier.joblib"
 
 def synthesize_training_data(n=5000, random_state=42):
     rng = np.random.RandomState(random_state)
-    rows = []
-    for _ in range(n):
-        age = rng.randint(18,65)
-        gender = rng.choice([0,1])  # 0 female, 1 male
-        height = rng.randint(150,195)
-        weight = rng.randint(45,110)
-        activity_days = rng.randint(0,7)
-        goal = rng.choice([0,1,2])  # 0 lose,1 maintain,2 gain
-        diet_pref = rng.choice([0,1])  # 0 veg,1 nonveg
-        bmi = weight / ((height/100)**2)
-        tdee = 2000 + rng.randint(-300,300)
-        total_cal = max(1200, int(tdee + (300 if goal==2 else (-400 if goal==0 else 0))))
-        meal_target = total_cal / 3.0
-        protein_per_kg = 1.6 if goal==2 else (1.3 if goal==1 else 1.4)
-        protein_total = protein_per_kg * weight
-        meal_protein = protein_total / 3.0
-        if goal == 0: wc = 0
-        elif goal == 2: wc = 1
-        else: wc = 2
-        rows.append({
-            "age": age, "gender": gender, "height_cm": height, "weight_kg": weight,
-            "activity_days": activity_days, "bmi": bmi, "tdee": tdee, "goal": goal,
-            "diet_pref": diet_pref, "meal_kcal": meal_target, "meal_protein_g": meal_protein,
-            "workout_cat": wc
-        })
-    df = pd.DataFrame(rows)
+    # every column drawn as a whole array (one RNG call each) rather than row by row
+    age = rng.randint(18,65, n)
+    gender = rng.choice([0,1], n)  # 0 female, 1 male
+    height = rng.randint(150,195, n)
+    weight = rng.randint(45,110, n)
+    activity_days = rng.randint(0,7, n)
+    goal = rng.choice([0,1,2], n)  # 0 lose,1 maintain,2 gain
+    diet_pref = rng.choice([0,1], n)  # 0 veg,1 nonveg
+    bmi = weight / ((height/100)**2)
+    tdee = 2000 + rng.randint(-300,300, n)
+    total_cal = np.maximum(1200, tdee + np.where(goal==2, 300, np.where(goal==0, -400, 0)))
+    meal_target = total_cal / 3.0
+    protein_per_kg = np.where(goal==2, 1.6, np.where(goal==1, 1.3, 1.4))
+    protein_total = protein_per_kg * weight
+    meal_protein = protein_total / 3.0
+    wc = np.where(goal==0, 0, np.where(goal==2, 1, 2))
+    df = pd.DataFrame({
+        "age": age, "gender": gender, "height_cm": height, "weight_kg": weight,
+        "activity_days": activity_days, "bmi": bmi, "tdee": tdee, "goal": goal,
+        "diet_pref": diet_pref, "meal_kcal": meal_target, "meal_protein_g": meal_protein,
+        "workout_cat": wc
+    })
     return df
 
+# Synthetic targets are smooth in the features, so shallow trees with 20-sample leaves fit them
+# well; that keeps the forests small, so they train quickly and unpickle fast. The regressor keeps
+# all features per split: with max_features='sqrt' it often misses tdee/goal and its error doubles,
+# while halving its trees to 50 costs almost nothing
+RF_TREE_PARAMS = dict(max_depth=12, min_samples_leaf=20)
+MODEL_COMPRESS = 3  # joblib zlib level: smaller files to read on load
+
+# Loaded (or trained) once per process; reruns reuse the same model objects
+@st.cache_resource(show_spinner=False)
 def train_and_save_models(force_retrain=False):
     # load if exist
     if DIET_MODEL_PATH.exists() and WORKOUT_MODEL_PATH.exists() and not force_retrain:
@@ -234,35 +384,39 @@ def train_and_save_models(force_retrain=False):
         workout_model = joblib.load(WORKOUT_MODEL_PATH)
         return diet_model, workout_model
 
-    # train quietly
+    # train quietly (sklearn is only needed here; loading the pickles pulls in just the model classes)
+    from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_squared_error, accuracy_score
+    from sklearn.compose import TransformedTargetRegressor
+    from sklearn.preprocessing import StandardScaler
     df = synthesize_training_data(n=6000)
     features = ["age","gender","height_cm","weight_kg","activity_days","bmi","tdee","goal","diet_pref"]
     X = df[features]
-    # meal kcal regressor
-    X_train, X_test, y_train_k, y_test_k = train_test_split(X, df["meal_kcal"], test_size=0.2, random_state=42)
-    _, _, y_train_p, y_test_p = train_test_split(X, df["meal_protein_g"], test_size=0.2, random_state=42)
-    diet_reg_k = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
-    diet_reg_p = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
-    diet_reg_k.fit(X_train, y_train_k)
-    diet_reg_p.fit(X_train, y_train_p)
+    # one shuffled split shared by the meal kcal/protein regressors and the workout classifier
+    # (the separate calls all used random_state=42, so they drew the same rows)
+    X_train, X_test, y_train_k, y_test_k, y_train_p, y_test_p, yw_train, yw_test = train_test_split(
+        X, df["meal_kcal"], df["meal_protein_g"], df["workout_cat"], test_size=0.2, random_state=42)
+    # one forest predicting [meal kcal, meal protein] together: a single set of trees to build and load.
+    # Targets are standardised so kcal (hundreds) doesn't drown out protein (tens) in the split criterion
+    diet_reg = TransformedTargetRegressor(
+        regressor=RandomForestRegressor(n_estimators=50, random_state=42, n_jobs=-1, **RF_TREE_PARAMS),
+        transformer=StandardScaler())
+    diet_reg.fit(X_train, np.column_stack([y_train_k, y_train_p]))
     # compute RMSE without squared kw param
-    ypred_k = diet_reg_k.predict(X_test)
-    ypred_p = diet_reg_p.predict(X_test)
-    rmse_k = float(np.sqrt(mean_squared_error(y_test_k, ypred_k))) if len(ypred_k)>0 else 0.0
-    rmse_p = float(np.sqrt(mean_squared_error(y_test_p, ypred_p))) if len(ypred_p)>0 else 0.0
+    ypred = diet_reg.predict(X_test)
+    rmse_k = float(np.sqrt(mean_squared_error(y_test_k, ypred[:, 0]))) if len(ypred)>0 else 0.0
+    rmse_p = float(np.sqrt(mean_squared_error(y_test_p, ypred[:, 1]))) if len(ypred)>0 else 0.0
     # save wrapper
-    diet_model = {"kcal_model": diet_reg_k, "protein_model": diet_reg_p, "features": features}
-    joblib.dump(diet_model, DIET_MODEL_PATH)
+    diet_model = {"model": diet_reg, "features": features}
+    joblib.dump(diet_model, DIET_MODEL_PATH, compress=MODEL_COMPRESS)
 
     # workout classifier
-    Xw = df[features]
-    yw = df["workout_cat"]
-    Xw_train, Xw_test, yw_train, yw_test = train_test_split(Xw, yw, test_size=0.2, random_state=42)
-    workout_clf = RandomForestClassifier(n_estimators=150, random_state=42, n_jobs=-1)
-    workout_clf.fit(Xw_train, yw_train)
-    yw_pred = workout_clf.predict(Xw_test)
+    workout_clf = RandomForestClassifier(n_estimators=150, random_state=42, n_jobs=-1, **RF_TREE_PARAMS)
+    workout_clf.fit(X_train, yw_train)
+    yw_pred = workout_clf.predict(X_test)
     acc = float(accuracy_score(yw_test, yw_pred)) if len(yw_test)>0 else 0.0
-    joblib.dump(workout_clf, WORKOUT_MODEL_PATH)
+    joblib.dump(workout_clf, WORKOUT_MODEL_PATH, compress=MODEL_COMPRESS)
 
     return diet_model, workout_clf
 
@@ -399,90 +553,40 @@ if st.session_state['recommendation_clicked']:
     calorie_target = int(max(1200, user_tdee - 500) if goal == "Lose Weight" else (user_tdee + 300 if goal == "Gain Weight" else user_tdee))
     st.success(f"### 🎯 Estimated daily calorie target: **{calorie_target} kcal**")
 
-    # prepare food columns mapping
-    cols = [c.lower() for c in food_df.columns]
-    name_col = None
-    for cand in ['fooditem','dish','description','name','food']:
-        if cand in cols:
-            name_col = food_df.columns[cols.index(cand)]
-            break
-    def get_col(df, keys):
-        lc = [c.lower() for c in df.columns]
-        for k in keys:
-            if k in lc:
-                return df.columns[lc.index(k)]
-        return None
-
-    cal_col = get_col(food_df, ['calories','energy','kcal'])
-    prot_col = get_col(food_df, ['protein'])
-    carbs_col = get_col(food_df, ['carb','carbs','carbohydrate'])
-    fat_col = get_col(food_df, ['fat'])
-    fibre_col = get_col(food_df, ['fibre','fiber'])
-    sugar_col = get_col(food_df, ['sugar'])
-
-    foods = food_df.copy()
-    foods['FoodItem'] = foods[name_col] if name_col else foods.iloc[:,0].astype(str)
-    for (cname, src) in [('Calories',cal_col), ('Protein',prot_col), ('Carbs',carbs_col), ('Fat',fat_col), ('Fibre',fibre_col), ('Sugar',sugar_col)]:
-        foods[cname] = pd.to_numeric(foods[src], errors='coerce').fillna(0) if src else 0.0
-
-    # strict veg/nonveg filtering using rda or inference
-    merged = foods.copy()
-    if not rda_df.empty and 'FoodItem' in rda_df.columns:
-        if 'VegNonVeg' in rda_df.columns:
-            try: rda_df['VegNonVeg'] = pd.to_numeric(rda_df['VegNonVeg'], errors='coerce')
-            except: pass
-        merged = pd.merge(foods, rda_df[['FoodItem','VegNonVeg']].drop_duplicates(), on='FoodItem', how='left')
-    else:
-        merged['VegNonVeg'] = np.nan
-    merged['InferredVegFlag'] = merged.apply(lambda r: infer_veg_flag(str(r.get('FoodItem','')), str(r.get(name_col,'')) if name_col else ""), axis=1)
-    def coalesce_flag(row):
-        v = row.get('VegNonVeg')
-        if pd.isna(v): return row.get('InferredVegFlag')
-        try: return int(v)
-        except: return row.get('InferredVegFlag')
-    merged['FinalVegFlag'] = merged.apply(coalesce_flag, axis=1)
+    # user-independent food table (cached), then the per-user filters
+    merged = build_food_index(str(FOOD_MASTER_FILE), file_mtime(FOOD_MASTER_FILE),
+                              str(RDA_CLEANED_FILE), file_mtime(RDA_CLEANED_FILE))
     if diet_pref == 'Veg':
         merged = merged[(merged['FinalVegFlag'].isna()) | (merged['FinalVegFlag'] == 0)].copy()
     elif diet_pref == 'NonVeg':
         merged = merged[(merged['FinalVegFlag'].isna()) | (merged['FinalVegFlag'] == 1)].copy()
     filtered_foods = merged
+    # per-row safety masks, carried through to the candidates for their SafetyFlag
+    filtered_foods['_avoid'] = False
+    filtered_foods['_limited'] = False
 
     # medical food rules (safety) - capture removed & limited lists for UI
     food_removed = []
     food_limited = []
     if med_condition != "None" and not safety_rules['medical_food'].empty:
         try:
-            mf = safety_rules['medical_food']
-            lc = mf['condition'].str.lower() if 'condition' in mf.columns else pd.Series([])
-            idx = lc[lc == med_condition.lower()].index
-            if len(idx):
-                row = mf.loc[idx[0]]
+            row = safety_rules['medical_food_by_cond'].get(med_condition.lower())
+            if row is not None:
                 # avoid tokens
-                avoid_text = str(row.get('avoid', "") or "")
-                avoid_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', avoid_text) if t.strip())
-                if avoid_tokens:
-                    def contains_avoid(name):
-                        s = str(name).lower()
-                        for tok in avoid_tokens:
-                            if tok and tok in s:
-                                return True
-                        return False
+                avoid_re = row['_avoid_re']
+                if avoid_re is not None:
                     # items to be removed
-                    removed_mask = filtered_foods['FoodItem'].astype(str).apply(contains_avoid)
+                    removed_mask = token_mask(filtered_foods['LowerName'], avoid_re)
+                    filtered_foods['_avoid'] = removed_mask
                     removed_items = filtered_foods.loc[removed_mask, 'FoodItem'].unique().tolist()
                     food_removed = removed_items
                     filtered_foods = filtered_foods[~removed_mask].copy()
                 # limited tokens: flag but keep
-                limit_text = str(row.get('limit', "") or "")
-                limit_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', limit_text) if t.strip())
-                if limit_tokens:
-                    def contains_limit(name):
-                        s = str(name).lower()
-                        for tok in limit_tokens:
-                            if tok and tok in s:
-                                return True
-                        return False
-                    limited_items = filtered_foods.loc[filtered_foods['FoodItem'].astype(str).apply(contains_limit), 'FoodItem'].unique().tolist()
+                limit_re = row['_limit_re']
+                if limit_re is not None:
+                    limited_mask = token_mask(filtered_foods['LowerName'], limit_re)
+                    filtered_foods['_limited'] = limited_mask
+                    limited_items = filtered_foods.loc[limited_mask, 'FoodItem'].unique().tolist()
                     food_limited = limited_items
         except Exception:
             pass
@@ -503,8 +607,13 @@ if st.session_state['recommendation_clicked']:
 
     # Predict per-meal kcal & protein
     try:
-        pred_meal_kcal = int(diet_model["kcal_model"].predict(X_user)[0]) if diet_model and X_user is not None else int(calorie_target/3)
-        pred_meal_protein = float(diet_model["protein_model"].predict(X_user)[0]) if diet_model and X_user is not None else float(1.5 * weight_kg / 3.0)
+        if diet_model and X_user is not None and "model" in diet_model:
+            pred_kcal, pred_protein = diet_model["model"].predict(X_user)[0]
+            pred_meal_kcal, pred_meal_protein = int(pred_kcal), float(pred_protein)
+        else:
+            # separate kcal/protein forests, as saved by older versions of this app
+            pred_meal_kcal = int(diet_model["kcal_model"].predict(X_user)[0]) if diet_model and X_user is not None else int(calorie_target/3)
+            pred_meal_protein = float(diet_model["protein_model"].predict(X_user)[0]) if diet_model and X_user is not None else float(1.5 * weight_kg / 3.0)
     except Exception:
         # fallback rules
         if goal == "Lose Weight":
@@ -519,23 +628,15 @@ if st.session_state['recommendation_clicked']:
 
     # Candidate filtering by calories around predicted meal kcal
     meal_target = pred_meal_kcal
+    # (boolean indexing already returns a new frame, so no extra .copy())
     min_c, max_c = meal_target * 0.6, meal_target * 1.4
-    cand = filtered_foods[(filtered_foods['Calories'] >= min_c) & (filtered_foods['Calories'] <= max_c)].copy()
+    cand = filtered_foods[filtered_foods['Calories'].between(min_c, max_c)]
     if cand.empty:
-        cand = filtered_foods[(filtered_foods['Calories'] >= meal_target*0.5) & (filtered_foods['Calories'] <= meal_target*1.6)].copy()
+        cand = filtered_foods[filtered_foods['Calories'].between(meal_target*0.5, meal_target*1.6)]
 
     diet_top = pd.DataFrame(columns=['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar','SafetyFlag'])
     if not cand.empty:
-        cand['Calories'] = pd.to_numeric(cand['Calories'], errors='coerce').fillna(0)
-        cand['Protein'] = pd.to_numeric(cand['Protein'], errors='coerce').fillna(0)
-        cand['Fibre'] = pd.to_numeric(cand['Fibre'], errors='coerce').fillna(0)
-        cand['cal_diff'] = (cand['Calories'] - meal_target).abs()
-        def norm(s):
-            if s.max()-s.min()==0: return s*0
-            return (s - s.min()) / (s.max() - s.min())
-        cand['n_cal'] = 1 - norm(cand['cal_diff'])
-        cand['n_prot'] = norm(cand['Protein'])
-        cand['n_fib'] = norm(cand['Fibre'])
+        # Calories/Protein/Fibre are already numeric with NaN filled by build_food_index
         # weights influenced by goal
         if goal == "Lose Weight":
             w_cal, w_prot, w_fib = 0.5, 0.35, 0.15
@@ -543,30 +644,29 @@ if st.session_state['recommendation_clicked']:
             w_cal, w_prot, w_fib = 0.45, 0.45, 0.10
         else:
             w_cal, w_prot, w_fib = 0.5, 0.35, 0.15
-        cand['score'] = cand['n_cal']*w_cal + cand['n_prot']*w_prot + cand['n_fib']*w_fib
-
-        # add safety flag column based on medical limits we discovered earlier
-        def safety_flag_row(r):
-            name = str(r['FoodItem']).lower()
-            for tok in (food_removed or []):
-                if tok.lower() in name: return 'avoid'
-            for tok in (food_limited or []):
-                if tok.lower() in name: return 'limited'
-            return 'ok'
-        cand['SafetyFlag'] = cand.apply(safety_flag_row, axis=1)
+        cand['score'] = score_candidates(cand['Calories'].to_numpy(np.float64), cand['Protein'].to_numpy(np.float64),
+                                         cand['Fibre'].to_numpy(np.float64), float(meal_target), w_cal, w_prot, w_fib)
+
+        # add safety flag column from the medical masks computed earlier
+        # (as a Categorical: small int codes instead of one string object per row)
+        cand['SafetyFlag'] = pd.Categorical.from_codes(
+            np.select([cand['_avoid'].to_numpy(bool), cand['_limited'].to_numpy(bool)], [0, 1], default=2),
+            categories=SAFETY_FLAGS)
         cand = cand.sort_values(by='score', ascending=False)
         top_n = min(len(cand), 120)
-        sample_size = min(12, len(cand))
-        diet_top = cand.head(top_n).drop_duplicates(subset=['FoodItem']).sample(n=sample_size, random_state=42)[['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar','SafetyFlag']].reset_index(drop=True)
+        # positions of the first row per FoodItem within the top rows, then a seeded pick among them;
+        # RandomState(42).choice is exactly what .sample(random_state=42) draws, so the picks are the same
+        top = cand.head(top_n)
+        first = np.flatnonzero(~top['FoodItem'].duplicated().to_numpy())
+        sample_size = min(12, len(first))
+        pick = first[np.random.RandomState(42).choice(len(first), size=sample_size, replace=False)]
+        diet_top = top.iloc[pick][['FoodItem','Calories','Protein','Carbs','Fat','Fibre','Sugar','SafetyFlag']].reset_index(drop=True)
 
     st.subheader("🍽️ Top Diet Recommendations")
     if not diet_top.empty:
         # show SafetyFlag with styling in table: we'll map to readable column for UI
-        def fmt_flag(f):
-            if f=='avoid': return 'AVOID'
-            if f=='limited': return 'LIMITED'
-            return 'OK'
-        diet_top['SafetyFlag'] = diet_top['SafetyFlag'].apply(fmt_flag)
+        # (renames the three categories, not every row)
+        diet_top['SafetyFlag'] = diet_top['SafetyFlag'].cat.rename_categories(SAFETY_FLAG_LABELS)
         st.dataframe(diet_top, use_container_width=True)
     else:
         st.info("No diet items found for your selection. Check the food_master.csv contents or relax filters.")
@@ -587,6 +687,8 @@ if st.session_state['recommendation_clicked']:
                 ex['Calories_per_kg'] = pd.to_numeric(ex.get('Calories_per_kg', 0), errors='coerce').fillna(0)
         if 'Category' not in ex.columns:
             ex['Category'] = 'Mixed'
+        # a handful of distinct categories: Categorical codes instead of repeated strings
+        ex['Category'] = ex['Category'].astype('category')
         ex['Calories_per_kg'] = pd.to_numeric(ex['Calories_per_kg'], errors='coerce').fillna(0)
         ex['Est_Cals_session'] = ex['Calories_per_kg'] * float(weight_kg)
 
@@ -598,72 +700,45 @@ if st.session_state['recommendation_clicked']:
             pred_work_cat = 0 if goal=="Lose Weight" else (1 if goal=="Gain Weight" else 2)
 
         # apply medical exercise restrictions via safety_rules['medical_exercise']
-        ex_restricted = ex.copy()
+        # rules match against "activity category", built once; each rule block narrows one `live` mask
+        # (rows not removed so far) and the restricted table is taken once, after all of them
+        ex_text = (ex['Activity'].map(str) + " " + ex['Category'].astype(object).map(str)).str.lower()
+        live = pd.Series(True, index=ex.index)
+        # lowercased category ('' when missing) for the workout-category picks below, also lowercased once
+        ex_cat_lc = ex['Category'].str.lower().fillna('')
         ex_removed = []
         ex_limited = []
         ex_recommended = []
         if med_condition != "None" and not safety_rules['medical_exercise'].empty:
             try:
-                me = safety_rules['medical_exercise']
-                lc = me['condition'].str.lower() if 'condition' in me.columns else pd.Series([])
-                idx = lc[lc == med_condition.lower()].index
-                if len(idx):
-                    row = me.loc[idx[0]]
-                    avoid_text = str(row.get('avoid', "") or "")
-                    avoid_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', avoid_text) if t.strip())
-                    if avoid_tokens:
-                        def contains_avoid(name, cat):
-                            s = (str(name)+" "+str(cat)).lower()
-                            for tok in avoid_tokens:
-                                if tok and tok in s:
-                                    return True
-                            return False
-                        removed_mask = ex_restricted.apply(lambda r: contains_avoid(r.get('Activity',''), r.get('Category','')), axis=1)
-                        ex_removed = ex_restricted.loc[removed_mask, 'Activity'].unique().tolist()
-                        ex_restricted = ex_restricted[~removed_mask].copy()
-                    limit_text = str(row.get('limit', "") or "")
-                    limit_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', limit_text) if t.strip())
-                    if limit_tokens:
-                        def contains_limit(name, cat):
-                            s = (str(name)+" "+str(cat)).lower()
-                            for tok in limit_tokens:
-                                if tok and tok in s: return True
-                            return False
-                        ex_limited = ex_restricted.loc[ex_restricted.apply(lambda r: contains_limit(r.get('Activity',''), r.get('Category','')), axis=1), 'Activity'].unique().tolist()
+                row = safety_rules['medical_exercise_by_cond'].get(med_condition.lower())
+                if row is not None:
+                    avoid_re = row['_avoid_re']
+                    if avoid_re is not None:
+                        removed_mask = live & token_mask(ex_text, avoid_re)
+                        ex_removed = ex.loc[removed_mask, 'Activity'].unique().tolist()
+                        live &= ~removed_mask
+                    limit_re = row['_limit_re']
+                    if limit_re is not None:
+                        ex_limited = ex.loc[live & token_mask(ex_text, limit_re), 'Activity'].unique().tolist()
             except Exception:
                 pass
 
         # gender adjustments
         if not safety_rules['gender_adjust'].empty:
             try:
-                gadf = safety_rules['gender_adjust']
                 gender_key = 'male' if gender.lower().startswith('m') else 'female'
-                rows = gadf[gadf['gender'].str.lower() == gender_key] if 'gender' in gadf.columns else pd.DataFrame()
-                if not rows.empty:
-                    avoid = str(rows.iloc[0].get('avoid','') or "")
-                    avoid_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', avoid) if t.strip())
-                    if avoid_tokens:
-                        def contains_avoid2(name, cat):
-                            s = (str(name)+" "+str(cat)).lower()
-                            for tok in avoid_tokens:
-                                if tok and tok in s:
-                                    return True
-                            return False
-                        removed_mask2 = ex_restricted.apply(lambda r: contains_avoid2(r.get('Activity',''), r.get('Category','')), axis=1)
-                        ex_removed += ex_restricted.loc[removed_mask2, 'Activity'].unique().tolist()
-                        ex_restricted = ex_restricted[~removed_mask2].copy()
-                    recommend = str(rows.iloc[0].get('recommend','') or "")
+                grow = safety_rules['gender_adjust_by_gender'].get(gender_key)
+                if grow is not None:
+                    avoid_re = grow['_avoid_re']
+                    if avoid_re is not None:
+                        removed_mask2 = live & token_mask(ex_text, avoid_re)
+                        ex_removed += ex.loc[removed_mask2, 'Activity'].unique().tolist()
+                        live &= ~removed_mask2
                     # if recommend provided, add to recommended list (search matching)
-                    if recommend:
-                        rec_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', recommend) if t.strip())
-                        if rec_tokens:
-                            def contains_rec(name, cat):
-                                s = (str(name)+" "+str(cat)).lower()
-                                for tok in rec_tokens:
-                                    if tok and tok in s:
-                                        return True
-                                return False
-                            ex_recommended += ex_restricted.loc[ex_restricted.apply(lambda r: contains_rec(r.get('Activity',''), r.get('Category','')), axis=1), 'Activity'].unique().tolist()
+                    rec_re = grow['_recommend_re']
+                    if rec_re is not None:
+                        ex_recommended += ex.loc[live & token_mask(ex_text, rec_re), 'Activity'].unique().tolist()
             except Exception:
                 pass
 
@@ -681,71 +756,58 @@ if st.session_state['recommendation_clicked']:
                             rowmatch = eligible.loc[[eligible['freq_days'].idxmax()]]
                     if not rowmatch.empty:
                         avoid_text = str(rowmatch.iloc[0].get('avoid','') or "")
-                        avoid_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', avoid_text) if t.strip())
-                        if avoid_tokens:
-                            def contains_avoid3(name, cat):
-                                s = (str(name)+" "+str(cat)).lower()
-                                for tok in avoid_tokens:
-                                    if tok and tok in s:
-                                        return True
-                                return False
-                            removed_mask3 = ex_restricted.apply(lambda r: contains_avoid3(r.get('Activity',''), r.get('Category','')), axis=1)
-                            ex_removed += ex_restricted.loc[removed_mask3, 'Activity'].unique().tolist()
-                            ex_restricted = ex_restricted[~removed_mask3].copy()
+                        avoid_re = rule_pattern(avoid_text)
+                        if avoid_re is not None:
+                            removed_mask3 = live & token_mask(ex_text, avoid_re)
+                            ex_removed += ex.loc[removed_mask3, 'Activity'].unique().tolist()
+                            live &= ~removed_mask3
                         recommend_text = str(rowmatch.iloc[0].get('recommend','') or "")
                         if recommend_text:
-                            rec_tokens = set(t.strip().lower() for t in re.split(r'[|,;]', recommend_text) if t.strip())
-                            if rec_tokens:
-                                def contains_rec2(name, cat):
-                                    s = (str(name)+" "+str(cat)).lower()
-                                    for tok in rec_tokens:
-                                        if tok and tok in s: return True
-                                    return False
-                                ex_recommended += ex_restricted.loc[ex_restricted.apply(lambda r: contains_rec2(r.get('Activity',''), r.get('Category','')), axis=1), 'Activity'].unique().tolist()
+                            rec_re = rule_pattern(recommend_text)
+                            if rec_re is not None:
+                                ex_recommended += ex.loc[live & token_mask(ex_text, rec_re), 'Activity'].unique().tolist()
             except Exception:
                 pass
 
         # choose exercises based on predicted category
+        ex_restricted = ex[live]
+        cat_lc = ex_cat_lc[live]
         if pred_work_cat == 0:
             ex_candidates = ex_restricted.sort_values(by='Calories_per_kg', ascending=False)
         elif pred_work_cat == 1:
-            mask = ex_restricted['Category'].str.lower().fillna('').apply(lambda s: any(x in s for x in ['strength','resistance','weight','power','body']))
+            mask = cat_lc.str.contains(STRENGTH_CATEGORY_RE)
             ex_candidates = ex_restricted[mask]
             if ex_candidates.empty:
                 ex_candidates = ex_restricted.sort_values(by='Calories_per_kg', ascending=False)
         else:
-            mask_cardio = ex_restricted['Category'].str.lower().fillna('').str.contains('cardio')
-            mask_strength = ex_restricted['Category'].str.lower().fillna('').str.contains('strength')
-            ex_candidates = pd.concat([ex_restricted[mask_cardio].head(6), ex_restricted[mask_strength].head(6)])
+            # first 6 cardio rows then first 6 strength rows, gathered with a single iloc
+            pos_cardio = np.flatnonzero(cat_lc.str.contains('cardio').to_numpy())[:6]
+            pos_strength = np.flatnonzero(cat_lc.str.contains('strength').to_numpy())[:6]
+            ex_candidates = ex_restricted.iloc[np.concatenate([pos_cardio, pos_strength])]
             if ex_candidates.empty:
                 ex_candidates = ex_restricted.sort_values(by='Calories_per_kg', ascending=False).head(12)
 
         ex_candidates = ex_candidates.drop_duplicates(subset=['Activity'])
         sample_size_ex = min(8, len(ex_candidates))
-        ex_top = ex_candidates.head(min(len(ex_candidates),40)).sample(n=sample_size_ex, random_state=42).reset_index(drop=True)
+        # same seeded positional pick as .sample(random_state=42), taken with one iloc
+        ex_pool = ex_candidates.head(40)
+        pick = np.random.RandomState(42).choice(len(ex_pool), size=sample_size_ex, replace=False)
+        ex_top = ex_pool.iloc[pick].reset_index(drop=True)
 
         # populate demo links
-        def make_youtube_search_link(name):
-            q = urllib.parse.quote_plus(name or "")
-            return f"https://www.youtube.com/results?search_query={q}"
-
-        def ensure_url(s):
-            if not s or pd.isna(s) or str(s).strip()=="":
-                return make_youtube_search_link("")
-            stt = str(s).strip()
-            if stt.startswith("http://") or stt.startswith("https://"):
-                return stt
-            return make_youtube_search_link(stt)
+        def demo_links(raw: pd.Series):
+            # URLs pass through; any other text (or a blank -> "") becomes a YouTube search, column-wise
+            txt = raw.where(raw.notna(), "").map(str).str.strip()
+            search = "https://www.youtube.com/results?search_query=" + txt.map(urllib.parse.quote_plus)
+            return txt.where(txt.str.startswith(("http://", "https://")), search)
 
+        link_src = ex_top['Activity']
         if not videos_df.empty:
             vcols = [c for c in videos_df.columns if 'url' in c.lower() or 'link' in c.lower() or 'video' in c.lower()]
             if vcols:
                 videos_map = videos_df.set_index(videos_df.columns[0])[vcols[0]].to_dict()
-                ex_top['demo_link'] = ex_top['Activity'].apply(lambda x: ensure_url(videos_map.get(x, "")))
-            else:
-                ex_top['demo_link'] = ex_top['Activity'].apply(lambda x: ensure_url(x))
-        else:
-            ex_top['demo_link'] = ex_top['Activity'].apply(lambda x: ensure_url(x))
+                link_src = ex_top['Activity'].map(videos_map)
+        ex_top['demo_link'] = demo_links(link_src)
 
         # collect ex_limited and ex_recommended names (dedupe)
         ex_limited = list(set(ex_limited))
@@ -758,18 +820,16 @@ if st.session_state['recommendation_clicked']:
 
         headers = list(display_ex.columns)
         header_html = "<tr>" + "".join([f"<th style='padding:6px;border:1px solid #ddd'>{h}</th>" for h in headers]) + "</tr>"
-        html_rows = []
-        for _, row in display_ex.iterrows():
-            act = str(row['Activity']); cat = str(row['Category'])
-            cpk = f"{float(row['Cal/kg']):.2f}" if row['Cal/kg'] else "0"
-            est = f"{int(row['Est_kcal/session'])}" if row['Est_kcal/session'] else "0"
-            link = str(row['Demo Link'])
-            link_html = f"<a href='{link}' target='_blank' rel='noopener noreferrer'>Watch</a>"
-            html_rows.append(f"<tr><td style='padding:6px;border:1px solid #ddd'>{act}</td>"
-                             f"<td style='padding:6px;border:1px solid #ddd'>{cat}</td>"
-                             f"<td style='padding:6px;border:1px solid #ddd'>{cpk}</td>"
-                             f"<td style='padding:6px;border:1px solid #ddd'>{est}</td>"
-                             f"<td style='padding:6px;border:1px solid #ddd;text-align:center'>{link_html}</td></tr>")
+        # rows built from plain column lists (no iterrows Series per row), one f-string each
+        cols = zip(display_ex['Activity'].tolist(), display_ex['Category'].tolist(), display_ex['Cal/kg'].tolist(),
+                   display_ex['Est_kcal/session'].tolist(), display_ex['Demo Link'].tolist())
+        html_rows = [f"<tr><td style='padding:6px;border:1px solid #ddd'>{act}</td>"
+                     f"<td style='padding:6px;border:1px solid #ddd'>{cat}</td>"
+                     f"<td style='padding:6px;border:1px solid #ddd'>{f'{cpk:.2f}' if cpk else '0'}</td>"
+                     f"<td style='padding:6px;border:1px solid #ddd'>{int(est) if est else '0'}</td>"
+                     f"<td style='padding:6px;border:1px solid #ddd;text-align:center'>"
+                     f"<a href='{link}' target='_blank' rel='noopener noreferrer'>Watch</a></td></tr>"
+                     for act, cat, cpk, est, link in cols]
         html_table = f"<table style='border-collapse:collapse;width:100%'>{header_html}{''.join(html_rows)}</table>"
 
         st.subheader("🏋️ Exercise Recommendations")
@@ -789,11 +849,10 @@ if st.session_state['recommendation_clicked']:
     # gender specific note
     if not safety_rules['gender_adjust'].empty:
         try:
-            gadf = safety_rules['gender_adjust']
             gender_key = 'male' if gender.lower().startswith('m') else 'female'
-            rows = gadf[gadf['gender'].str.lower() == gender_key] if 'gender' in gadf.columns else pd.DataFrame()
-            if not rows.empty:
-                adv = str(rows.iloc[0].get('recommend','') or "")
+            grow = safety_rules['gender_adjust_by_gender'].get(gender_key)
+            if grow is not None:
+                adv = str(grow.get('recommend','') or "")
                 if adv:
                     tips.append(f"Gender-specific note: {adv}")
         except Exception:
@@ -813,20 +872,23 @@ if st.session_state['recommendation_clicked']:
             "exercise_top": ex_top.to_dict(orient='records') if 'ex_top' in locals() else [],
             "tips": tips,
             "safety": {"food_removed": food_removed, "food_limited": food_limited, "ex_removed": ex_removed, "ex_limited": ex_limited, "ex_recommended": ex_recommended}}
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(plan, f, indent=2)
+    if HAS_ORJSON:
+        json_path.write_bytes(orjson.dumps(plan, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=2)
     st.success("✅ Plan saved successfully!")
 
     pdf_path = safe_out / f"plan_{safe_name}_{now_tag}.pdf"
-    create_pdf(user, diet_top if not diet_top.empty else None, ex_top if 'ex_top' in locals() else None, tips, pdf_path)
-    with open(pdf_path, "rb") as f:
-        st.download_button(
-            label="📄 Download My Plan (PDF)",
-            data=f,
-            file_name=pdf_path.name,
-            mime="application/pdf",
-            type="primary"
-        )
+    # the saved copy is written from the same bytes the download serves, with no read-back
+    pdf_bytes = create_pdf(user, diet_top if not diet_top.empty else None, ex_top if 'ex_top' in locals() else None, tips, pdf_path)
+    st.download_button(
+        label="📄 Download My Plan (PDF)",
+        data=pdf_bytes,
+        file_name=pdf_path.name,
+        mime="application/pdf",
+        type="primary"
+    )
 
 # ---------------------------
 # Chatbot - user's detailed function (kept intact)
@@ -838,13 +900,15 @@ st.markdown("---")
 st.subheader("💬 Health Assistant Chatbot")
 st.markdown("*Ask me about TDEE, BMR, protein intake, symptoms, diet tips, or how to use this app!*")
 
+CHAT_GREETINGS = ("hi", "hello", "hey", "hii", "hai", "namaste")  # checked as substrings, in order
+
 def custom_chatbot_response(query, context):
     q = query.lower().strip()
     # Insert full user-provided chatbot function body here (unchanged).
     # For brevity we use a condensed version of the start and the common responses — in your file,
     # paste the entire function body you provided earlier (the long one).
     # Start:
-    if any(w in q for w in ["hi", "hello", "hey", "hii", "hai", "namaste"]):
+    if any(w in q for w in CHAT_GREETINGS):
         name = context.get('name', '')
         if name:
             return f"Hello {name}! 👋 How can I assist you today? Ask me about diet, exercise, symptoms, medical conditions, nutrition, or fitness tips!"
@@ -5,15 +5,12 @@ import numpy as np
 from pathlib import Path
 import json
 import datetime
-from fpdf import FPDF  # pip install fpdf
 import urllib.parse
+import importlib.util
+import re
 
-# Optional OpenAI usage; import on-demand
-try:
-    import openai
-    HAS_OPENAI = True
-except Exception:
-    HAS_OPENAI = False
+# Optional OpenAI usage flag (only checks availability; the module is imported when the chatbot uses it)
+HAS_OPENAI = importlib.util.find_spec('openai') is not None
 
 st.set_page_config(page_title="AI Diet & Workout Recommender", layout="wide")
 
@@ -30,10 +27,15 @@ EXERCISE_VIDEOS_FILE = DATA_DIR / "exercise_videos.csv"  # optional
 # ---------------------------
 # Helper Functions
 # ---------------------------
+# Parsed once per file version and shared across reruns: the mtime in the key invalidates the cache when a CSV changes
+@st.cache_data(show_spinner=False)
+def load_csv(p_str: str, mtime: float):
+    return pd.read_csv(p_str)
+
 def safe_read_csv(p: Path):
     if p.exists():
         try:
-            return pd.read_csv(p)
+            return load_csv(str(p), p.stat().st_mtime)
         except Exception as e:
             st.error(f"Error reading {p.name}: {e}")
             return pd.DataFrame()
@@ -55,11 +57,23 @@ def tdee_bmr(age, gender, height_cm, weight_kg, activity_days):
         af = 1.725
     return bmr * af
 
-def make_youtube_search_link(name):
-    q = urllib.parse.quote_plus(name)
-    return f"https://www.youtube.com/results?search_query={q}"
+YOUTUBE_SEARCH_URL = "https://www.youtube.com/results?search_query="
+
+PDF_EX_COLS = ['Activity', 'Category', 'Calories_per_kg', 'Est_Cals_session']
+
+def pdf_diet_rows(diet_table):
+    # header labels plus every cell string, built up front from row tuples
+    headers = list(diet_table.columns[:6])
+    rows = diet_table.head(20)[headers].itertuples(index=False, name=None)
+    return [str(h) for h in headers], [[str(v)[:25] for v in r] for r in rows]
+
+def pdf_exercise_rows(exercise_table):
+    # (activity, category, cal/kg, kcal/session) strings per row
+    ex20 = exercise_table.head(20)[PDF_EX_COLS]
+    return [(str(a)[:30], str(c), f"{ckg:.2f}", f"{int(est)}") for a, c, ckg, est in ex20.itertuples(index=False, name=None)]
 
 def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
+    from fpdf import FPDF  # pip install fpdf (imported on first PDF, not on every rerun)
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=12)
     pdf.add_page()
@@ -75,14 +89,10 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     pdf.set_font("Arial", size=9)
     if not diet_table.empty:
         colw = [60, 22, 22, 22, 22, 22]
-        headers = list(diet_table.columns[:6])
-        for i, h in enumerate(headers):
-            pdf.cell(colw[i], 6, str(h), border=1)
-        pdf.ln()
-        for _, r in diet_table.head(20).iterrows():
-            vals = [str(r.get(c,"")) for c in headers]
-            for i,v in enumerate(vals):
-                pdf.cell(colw[i], 6, v[:25], border=1)
+        headers, rows = pdf_diet_rows(diet_table)
+        for vals in [headers] + rows:
+            for w, v in zip(colw, vals):
+                pdf.cell(w, 6, v, border=1)
             pdf.ln()
     else:
         pdf.cell(0, 6, "No diet recommendations found.", ln=True)
@@ -91,15 +101,9 @@ def create_pdf(user_info, diet_table, exercise_table, tips, out_path):
     pdf.cell(0, 6, "Exercise Recommendations (Top)", ln=True)
     pdf.set_font("Arial", size=9)
     if not exercise_table.empty:
-        headers = list(exercise_table[['Activity','Category','Calories_per_kg','Est_Cals_session']].columns)
-        for h in headers:
-            pdf.cell(45, 6, str(h), border=1)
-        pdf.ln()
-        for _, r in exercise_table.head(20).iterrows():
-            pdf.cell(45, 6, str(r['Activity'])[:30], border=1)
-            pdf.cell(45, 6, str(r['Category']), border=1)
-            pdf.cell(45, 6, f"{r['Calories_per_kg']:.2f}", border=1)
-            pdf.cell(45, 6, f"{int(r['Est_Cals_session'])}", border=1)
+        for vals in [PDF_EX_COLS] + pdf_exercise_rows(exercise_table):
+            for v in vals:
+                pdf.cell(45, 6, v, border=1)
             pdf.ln()
     else:
         pdf.cell(0, 6, "No exercise recommendations found.", ln=True)
@@ -180,8 +184,11 @@ if st.button("Get Recommendations"):
 
     foods = food_df.copy()
     foods['FoodItem'] = foods[name_col] if name_col else foods.iloc[:,0]
-    for (cname, src) in [('Calories',cal_col), ('Protein',prot_col), ('Carbs',carbs_col), ('Fat',fat_col), ('Fibre',fibre_col), ('Sugar',sugar_col)]:
-        foods[cname] = pd.to_numeric(foods[src], errors='coerce').fillna(0) if src else 0.0
+    # coerce every found nutrient column in one pass; missing ones become 0.0
+    src_map = {'Calories': cal_col, 'Protein': prot_col, 'Carbs': carbs_col, 'Fat': fat_col, 'Fibre': fibre_col, 'Sugar': sugar_col}
+    present = {k: v for k, v in src_map.items() if v}
+    nutrients = foods[list(present.values())].apply(pd.to_numeric, errors='coerce').fillna(0).set_axis(list(present), axis=1)
+    foods[list(src_map)] = nutrients.reindex(columns=list(src_map), fill_value=0.0)
 
     # ✅ Correct Veg/NonVeg filtering
     filtered_foods = foods.copy()
@@ -201,7 +208,10 @@ if st.button("Get Recommendations"):
         if not row.empty:
             avoid_text = str(row.iloc[0].get('Avoid',''))
             avoid_tokens = [t.strip().lower() for t in avoid_text.split(',') if t.strip()]
-            filtered_foods = filtered_foods[~filtered_foods['FoodItem'].astype(str).str.lower().apply(lambda x: any(tok in x for tok in avoid_tokens))]
+            if avoid_tokens:
+                # one compiled alternation, matched over the whole column (same substring test as `tok in x`)
+                avoid_pat = re.compile('|'.join(map(re.escape, avoid_tokens)))
+                filtered_foods = filtered_foods[~filtered_foods['FoodItem'].astype(str).str.lower().str.contains(avoid_pat, na=False)]
 
     meal_target = calorie_target / 3
     min_c, max_c = meal_target*0.75, meal_target*1.25
@@ -228,24 +238,30 @@ if st.button("Get Recommendations"):
         ex['Calories_per_kg'] = pd.to_numeric(ex['MET'], errors='coerce')*1.05 if 'MET' in ex.columns else 0.0
     if 'Category' not in ex.columns:
         ex['Category'] = 'Mixed'
+    # a handful of distinct categories: Categorical codes, and .str ops below run once per category
+    ex['Category'] = ex['Category'].astype('category')
     ex['Calories_per_kg'] = pd.to_numeric(ex['Calories_per_kg'], errors='coerce').fillna(0)
     ex['Est_Cals_session'] = ex['Calories_per_kg'] * weight_kg
 
+    cat_lc = ex['Category'].str.lower()
+    is_strength = cat_lc.str.contains('strength', na=False)
+    is_cardio = cat_lc.str.contains('cardio', na=False)
+
     if goal == "Lose Weight":
         ex_candidates = ex.sort_values(by='Calories_per_kg', ascending=False)
     elif goal == "Gain Weight":
-        ex_candidates = ex[ex['Category'].str.lower().str.contains('strength')]
+        ex_candidates = ex[is_strength]
         if ex_candidates.empty:
             ex_candidates = ex.sort_values(by='Calories_per_kg', ascending=False)
     else:
-        cardio = ex[ex['Category'].str.lower().str.contains('cardio')].head(3)
-        strength = ex[ex['Category'].str.lower().str.contains('strength')].head(2)
+        cardio = ex[is_cardio].head(3)
+        strength = ex[is_strength].head(2)
         ex_candidates = pd.concat([cardio, strength])
     if ex_candidates.empty:
         ex_candidates = ex.sort_values(by='Calories_per_kg', ascending=False).head(5)
 
     ex_top = ex_candidates.head(10).reset_index(drop=True)
-    ex_top['demo_link'] = ex_top['Activity'].apply(lambda x: make_youtube_search_link(x))
+    ex_top['demo_link'] = YOUTUBE_SEARCH_URL + ex_top['Activity'].map(urllib.parse.quote_plus)
 
     st.subheader("🏋️ Exercise Recommendations")
     display_ex = ex_top[['Activity','Category','Calories_per_kg','Est_Cals_session','demo_link']].rename(columns={'Calories_per_kg':'Cal/kg','Est_Cals_session':'Est_kcal/session','demo_link':'Demo Link'})
@@ -293,13 +309,13 @@ if st.button("Get Recommendations"):
     st.markdown("---")
     st.subheader("Chatbot (Ask about app, TDEE, or diet tips)")
     use_openai = bool(openai_key and HAS_OPENAI)
-    if use_openai:
-        openai.api_key = openai_key
 
     q = st.text_input("Ask something", "")
     if st.button("Send"):
         if use_openai:
             try:
+                import openai
+                openai.api_key = openai_key
                 resp = openai.ChatCompletion.create(
                     model="gpt-3.5-turbo",
                     messages=[{"role":"system","content":"You are a health assistant."},{"role":"user","content":q}],